@@ -0,0 +1,65 @@
+"""Server side timestamps and bigint ids
+
+Revision ID: 3d5f0b8a6e12
+Revises: 1a6c8e4b9f25
+Create Date: 2026-10-19 14:47:20.551093
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3d5f0b8a6e12"
+down_revision: Union[str, None] = "1a6c8e4b9f25"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+content_id = sa.BigInteger().with_variant(sa.Integer(), "sqlite")
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("posts") as batch_op:
+        batch_op.alter_column(
+            "id", existing_type=sa.Integer(), type_=content_id, autoincrement=True
+        )
+        batch_op.alter_column(
+            "date_time_created",
+            existing_type=sa.DateTime(),
+            server_default=sa.func.now(),
+            existing_nullable=False,
+        )
+    with op.batch_alter_table("comments") as batch_op:
+        batch_op.alter_column(
+            "id", existing_type=sa.Integer(), type_=content_id, autoincrement=True
+        )
+        batch_op.alter_column("post_id", existing_type=sa.Integer(), type_=content_id)
+        batch_op.alter_column(
+            "date_time_created",
+            existing_type=sa.DateTime(),
+            server_default=sa.func.now(),
+            existing_nullable=False,
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("comments") as batch_op:
+        batch_op.alter_column(
+            "date_time_created",
+            existing_type=sa.DateTime(),
+            server_default=None,
+            existing_nullable=False,
+        )
+        batch_op.alter_column("post_id", existing_type=content_id, type_=sa.Integer())
+        batch_op.alter_column("id", existing_type=content_id, type_=sa.Integer())
+    with op.batch_alter_table("posts") as batch_op:
+        batch_op.alter_column(
+            "date_time_created",
+            existing_type=sa.DateTime(),
+            server_default=None,
+            existing_nullable=False,
+        )
+        batch_op.alter_column("id", existing_type=content_id, type_=sa.Integer())
@@ -0,0 +1,414 @@
+"""Cold storage for old comments.
+
+Comments older than ``ARCHIVE_AFTER_DAYS`` are moved out of the live table
+into immutable segment files under ``ARCHIVE_DIR``, one segment per month of
+creation per archival run. A segment is a sequence of independently
+zlib-compressed NDJSON blocks of ``ARCHIVE_BLOCK_SIZE`` comments sorted by
+id; its ``.idx`` sidecar records the byte range, id range, post ids and
+per-day counts of every block. Readers keep the indexes in memory and map
+the segments with ``mmap``, so a cold lookup inflates a single block.
+
+Usage::
+
+    python -m app.archive
+"""
+
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, delete, func, select
+from sqlalchemy.orm import Session
+
+from app import moderation
+from db import models, sharding
+from db.engine import SessionLocal
+from db.ids import SNOWFLAKE_IDS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", 90))
+ARCHIVE_BLOCK_SIZE = int(os.getenv("ARCHIVE_BLOCK_SIZE", 1000))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 10000))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", 3600))
+RUN_ARCHIVAL = os.getenv("RUN_ARCHIVAL", "0") == "1"
+# Archived comments returned by a listing without a limit.
+ARCHIVE_UNPAGED_LIMIT = int(os.getenv("ARCHIVE_UNPAGED_LIMIT", 100))
+ARCHIVE_CACHED_BLOCKS = 64
+
+COLUMNS = [column.name for column in models.Comment.__table__.columns]
+DATETIME_COLUMNS = {"date_time_created", "deleted_at"}
+
+
+def _encode(comment) -> dict:
+    row = {name: getattr(comment, name) for name in COLUMNS}
+    for name in DATETIME_COLUMNS:
+        if row[name] is not None:
+            row[name] = row[name].isoformat()
+    return row
+
+
+def _decode(row: dict) -> models.Comment:
+    for name in DATETIME_COLUMNS:
+        if row[name] is not None:
+            row[name] = datetime.fromisoformat(row[name])
+    return models.Comment(**row)
+
+
+class Archive:
+    """Read access to the segments in one directory.
+
+    Indexes are reloaded whenever the directory changes, and the most
+    recently used blocks are kept inflated. When a comment was archived more
+    than once (an edit raced the archival job), its highest version wins.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._blocks: list[dict] = []
+        self._maps: dict[str, mmap.mmap] = {}
+        self._cache: OrderedDict[tuple[str, int], list[dict]] = OrderedDict()
+
+    def blocks(self) -> list[dict]:
+        """Every block, highest ids first."""
+        try:
+            stamp = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if stamp != self._stamp:
+                self._load()
+                self._stamp = stamp
+            return self._blocks
+
+    def _load(self) -> None:
+        blocks = []
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".idx"):
+                continue
+            with open(os.path.join(self.path, name)) as index:
+                segment = json.load(index)
+            for block in segment["blocks"]:
+                block["segment"] = os.path.join(self.path, segment["segment"])
+                block["post_ids"] = set(block["post_ids"])
+                # Indexes written before the authors map was added have
+                # none; such blocks are scanned instead.
+                block.setdefault("authors", None)
+                blocks.append(block)
+        self._blocks = sorted(blocks, key=lambda block: block["max_id"], reverse=True)
+
+    def max_id(self) -> int:
+        blocks = self.blocks()
+        return blocks[0]["max_id"] if blocks else 0
+
+    def _read(self, block: dict) -> list[dict]:
+        key = (block["segment"], block["offset"])
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            if block["segment"] not in self._maps:
+                with open(block["segment"], "rb") as segment:
+                    self._maps[block["segment"]] = mmap.mmap(
+                        segment.fileno(), 0, access=mmap.ACCESS_READ
+                    )
+            data = self._maps[block["segment"]][
+                block["offset"] : block["offset"] + block["length"]
+            ]
+
+        rows = [json.loads(line) for line in zlib.decompress(data).splitlines()]
+        with self._lock:
+            self._cache[key] = rows
+            if len(self._cache) > ARCHIVE_CACHED_BLOCKS:
+                self._cache.popitem(last=False)
+        return rows
+
+    def _rows(self, blocks) -> dict[int, dict]:
+        latest = {}
+        for block in blocks:
+            for row in self._read(block):
+                if (
+                    row["id"] not in latest
+                    or row["version"] > latest[row["id"]]["version"]
+                ):
+                    latest[row["id"]] = row
+        return latest
+
+    def versions(self, ids: list[int]) -> dict[int, int]:
+        if not ids:
+            return {}
+        low, high = min(ids), max(ids)
+        blocks = [
+            block
+            for block in self.blocks()
+            if block["min_id"] <= high and block["max_id"] >= low
+        ]
+        wanted = set(ids)
+        return {
+            row_id: row["version"]
+            for row_id, row in self._rows(blocks).items()
+            if row_id in wanted
+        }
+
+    def get(self, comment_id: int) -> models.Comment | None:
+        blocks = [
+            block
+            for block in self.blocks()
+            if block["min_id"] <= comment_id <= block["max_id"]
+        ]
+        row = self._rows(blocks).get(comment_id)
+        return _decode(dict(row)) if row else None
+
+    def comments(
+        self,
+        post_id: int | None = None,
+        cursor: int | None = None,
+        limit: int | None = None,
+        exclude=lambda post_ids: set(),
+        author_id: int | None = None,
+    ) -> list[models.Comment]:
+        """Archived comments, newest first and at most ``limit`` of them.
+
+        ``exclude`` maps a set of post ids to the ones whose comments must
+        be hidden; it is called once per block that could contribute.
+        """
+        found = {}
+        for block in self.blocks():
+            if cursor is not None and block["min_id"] >= cursor:
+                continue
+            if post_id is not None and post_id not in block["post_ids"]:
+                continue
+            if (
+                author_id is not None
+                and block["authors"] is not None
+                and str(author_id) not in block["authors"]
+            ):
+                continue
+            if limit is not None and len(found) >= limit:
+                # Blocks are ordered by their highest id; once the page is
+                # full, only a block overlapping it can still contribute.
+                if block["max_id"] < sorted(found, reverse=True)[limit - 1]:
+                    break
+
+            hidden = exclude(block["post_ids"])
+            for row in self._read(block):
+                if (
+                    (post_id is None or row["post_id"] == post_id)
+                    and (author_id is None or row["author_id"] == author_id)
+                    and (cursor is None or row["id"] < cursor)
+                    and row["post_id"] not in hidden
+                    and row["version"] > found.get(row["id"], {}).get("version", 0)
+                ):
+                    found[row["id"]] = row
+
+        ids = sorted(found, reverse=True)[:limit]
+        return [_decode(dict(found[row_id])) for row_id in ids]
+
+    def daily_counts(
+        self, date_from: datetime, date_to: datetime, exclude=lambda post_ids: set()
+    ) -> dict[str, list[int]]:
+        """``{day: [total, blocked]}`` for the archived days in the range.
+
+        Counts come straight from the indexes; no block is inflated.
+        """
+        counts = {}
+        for block in self.blocks():
+            if block["last_day"] < date_from.date().isoformat():
+                continue
+            if block["first_day"] > date_to.date().isoformat():
+                continue
+            hidden = exclude(block["post_ids"])
+            for day, per_post in block["days"].items():
+                start = datetime.fromisoformat(day)
+                if not date_from <= start < date_to:
+                    continue
+                totals = counts.setdefault(day, [0, 0])
+                for post_id, (total, blocked) in per_post.items():
+                    if int(post_id) not in hidden:
+                        totals[0] += total
+                        totals[1] += blocked
+        return counts
+
+    def post_counts(self) -> dict[int, list[int]]:
+        """``{post_id: [total, blocked]}`` of all archived comments."""
+        counts = {}
+        for block in self.blocks():
+            for per_post in block["days"].values():
+                for post_id, (total, blocked) in per_post.items():
+                    totals = counts.setdefault(int(post_id), [0, 0])
+                    totals[0] += total
+                    totals[1] += blocked
+        return counts
+
+    def author_counts(self) -> dict[int, dict[int, list[int]]]:
+        """``{author_id: {post_id: [total, blocked]}}`` of all archived comments."""
+        counts = {}
+        for block in self.blocks():
+            if block["authors"] is None:
+                for row in self._read(block):
+                    if row["author_id"] is not None:
+                        by_post = counts.setdefault(row["author_id"], {})
+                        totals = by_post.setdefault(row["post_id"], [0, 0])
+                        totals[0] += 1
+                        totals[1] += row["is_blocked"]
+                continue
+            for author_id, per_post in block["authors"].items():
+                by_post = counts.setdefault(int(author_id), {})
+                for post_id, (total, blocked) in per_post.items():
+                    totals = by_post.setdefault(int(post_id), [0, 0])
+                    totals[0] += total
+                    totals[1] += blocked
+        return counts
+
+
+archive = Archive(ARCHIVE_DIR)
+
+
+def write_segment(path: str, name: str, rows: list[dict], block_size: int) -> None:
+    """Write ``rows`` (sorted by id) as segment ``name`` and its index.
+
+    Both files are written under a temporary name and renamed, the index
+    last, so readers never see a partial segment.
+    """
+    blocks = []
+    offset = 0
+    with open(os.path.join(path, f"{name}.seg.tmp"), "wb") as segment:
+        for start in range(0, len(rows), block_size):
+            chunk = rows[start : start + block_size]
+            data = zlib.compress(
+                "\n".join(json.dumps(row) for row in chunk).encode(), 9
+            )
+            segment.write(data)
+
+            days = {}
+            authors = {}
+            for row in chunk:
+                groups = [days.setdefault(row["date_time_created"][:10], {})]
+                if row["author_id"] is not None:
+                    groups.append(authors.setdefault(str(row["author_id"]), {}))
+                for counts in groups:
+                    total, blocked = counts.get(str(row["post_id"]), (0, 0))
+                    counts[str(row["post_id"])] = (
+                        total + 1,
+                        blocked + row["is_blocked"],
+                    )
+            blocks.append(
+                {
+                    "offset": offset,
+                    "length": len(data),
+                    "min_id": chunk[0]["id"],
+                    "max_id": chunk[-1]["id"],
+                    "first_day": min(days),
+                    "last_day": max(days),
+                    "post_ids": sorted({row["post_id"] for row in chunk}),
+                    "days": days,
+                    "authors": authors,
+                }
+            )
+            offset += len(data)
+
+    with open(os.path.join(path, f"{name}.idx.tmp"), "w") as index:
+        json.dump({"segment": f"{name}.seg", "blocks": blocks}, index)
+    os.replace(os.path.join(path, f"{name}.seg.tmp"), os.path.join(path, f"{name}.seg"))
+    os.replace(os.path.join(path, f"{name}.idx.tmp"), os.path.join(path, f"{name}.idx"))
+
+
+def archive_comments(
+    db: Session,
+    cutoff: datetime,
+    path: str = ARCHIVE_DIR,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    block_size: int = ARCHIVE_BLOCK_SIZE,
+) -> int:
+    """Move live comments created before ``cutoff`` from ``db`` to the archive.
+
+    Soft-deleted comments are left to compaction and pending ones to the
+    moderation worker. A row is only deleted if its version did not change
+    after it was archived; an edited row stays live and is archived again
+    by a later run. Unless ids come from ``SNOWFLAKE_IDS``, the newest comment
+    always stays live so that SQLite never hands out an archived id again.
+    """
+    os.makedirs(path, exist_ok=True)
+    reader = archive if path == ARCHIVE_DIR else Archive(path)
+    table = models.Comment.__table__
+    archived = 0
+    last_id = 0
+    conditions = [
+        models.Comment.date_time_created < cutoff,
+        models.Comment.deleted_at.is_(None),
+        models.Comment.moderation_status != moderation.PENDING,
+    ]
+    if not SNOWFLAKE_IDS:
+        conditions.append(
+            models.Comment.id < select(func.max(models.Comment.id)).scalar_subquery()
+        )
+
+    while True:
+        comments = (
+            db.execute(
+                select(models.Comment)
+                .where(models.Comment.id > last_id, *conditions)
+                .order_by(models.Comment.id)
+                .limit(batch_size)
+            )
+            .scalars()
+            .all()
+        )
+        db.rollback()
+        if not comments:
+            return archived
+        last_id = comments[-1].id
+
+        rows = [_encode(comment) for comment in comments]
+        stored = reader.versions([row["id"] for row in rows])
+        partitions = {}
+        for row in rows:
+            if stored.get(row["id"]) != row["version"]:
+                partitions.setdefault(row["date_time_created"][:7], []).append(row)
+        for month, month_rows in partitions.items():
+            write_segment(
+                path,
+                f"comments-{month}-{month_rows[0]['id']}-{time.time_ns()}",
+                month_rows,
+                block_size,
+            )
+
+        db.execute(
+            delete(table).where(
+                table.c.id == bindparam("row_id"),
+                table.c.version == bindparam("row_version"),
+            ),
+            [{"row_id": row["id"], "row_version": row["version"]} for row in rows],
+        )
+        db.commit()
+        archived += len(rows)
+
+
+def run_archival() -> None:
+    cutoff = datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    db = SessionLocal()
+    try:
+        with sharding.comment_sessions(db) as sessions:
+            archived = sum(archive_comments(session, cutoff) for session in sessions)
+    finally:
+        db.close()
+
+    if archived:
+        logger.info("Archived %s comments", archived)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_archival()
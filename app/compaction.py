@@ -0,0 +1,105 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from db import models, sharding
+from db.engine import SessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+COMPACTION_INTERVAL = float(os.getenv("COMPACTION_INTERVAL", 60))
+COMPACTION_BATCH_SIZE = int(os.getenv("COMPACTION_BATCH_SIZE", 500))
+SOFT_DELETE_RETENTION_HOURS = float(os.getenv("SOFT_DELETE_RETENTION_HOURS", 24))
+
+
+def _purge_in_batches(db: Session, model, ids_query, batch_size: int) -> int:
+    purged = 0
+    while True:
+        ids = db.execute(ids_query.limit(batch_size)).scalars().all()
+        if not ids:
+            return purged
+        db.execute(delete(model).where(model.id.in_(ids)))
+        db.commit()
+        purged += len(ids)
+
+
+def compact(
+    db: Session,
+    retention: timedelta = timedelta(hours=SOFT_DELETE_RETENTION_HOURS),
+    batch_size: int = COMPACTION_BATCH_SIZE,
+) -> dict:
+    """Purge soft-deleted rows older than ``retention``.
+
+    Rows are removed in batches of ``batch_size``, each in its own short
+    transaction, so live traffic is never blocked behind a large delete.
+    Comments go first, then posts that have no comments left.
+    """
+    cutoff = datetime.utcnow() - retention
+    comments = sum(
+        sharding.fan_out(
+            db,
+            lambda session: _purge_in_batches(
+                session,
+                models.Comment,
+                select(models.Comment.id).where(models.Comment.deleted_at < cutoff),
+                batch_size,
+            ),
+        )
+    )
+
+    # Expired posts are taken a batch at a time: their comments go first,
+    # wherever they are stored, then their timeline entries and the posts.
+    expired_posts = select(models.Post.id).where(models.Post.deleted_at < cutoff)
+    posts = 0
+    while True:
+        post_ids = db.execute(expired_posts.limit(batch_size)).scalars().all()
+        if not post_ids:
+            break
+        comments += sum(
+            sharding.fan_out(
+                db,
+                lambda session: _purge_in_batches(
+                    session,
+                    models.Comment,
+                    select(models.Comment.id).where(
+                        models.Comment.post_id.in_(post_ids)
+                    ),
+                    batch_size,
+                ),
+            )
+        )
+        db.execute(
+            delete(models.TimelineEntry).where(
+                models.TimelineEntry.post_id.in_(post_ids)
+            )
+        )
+        db.execute(delete(models.Post).where(models.Post.id.in_(post_ids)))
+        db.commit()
+        posts += len(post_ids)
+    return {"posts": posts, "comments": comments}
+
+
+def run_compaction() -> None:
+    db = SessionLocal()
+    try:
+        purged = compact(db)
+    finally:
+        db.close()
+
+    if purged["posts"] or purged["comments"]:
+        logger.info(
+            "Purged %s soft-deleted posts and %s comments",
+            purged["posts"],
+            purged["comments"],
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_compaction()
@@ -0,0 +1,312 @@
+"""Response compression negotiated through ``Accept-Encoding``.
+
+gzip is always available; brotli and zstd are offered when the ``brotli``
+and ``zstandard`` packages are installed. Responses smaller than
+``COMPRESSION_MIN_SIZE`` bytes, streams (such as the comment event stream)
+and already encoded responses are sent as they are. Compression is limited
+to ``COMPRESSION_CPU_BUDGET`` CPU seconds per second per worker; past that
+responses go out uncompressed rather than slowing the worker down.
+
+Compressed ``GET`` responses are cached by the digest of their body, so a
+hot page is compressed once per encoding and then served from memory.
+
+Usage::
+
+    python -m app.compression [--repeat 20]
+
+prints the size and CPU cost of each encoding and level for a typical page
+of posts.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+load_dotenv()
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_CPU_BUDGET = float(os.getenv("COMPRESSION_CPU_BUDGET", 0.5))
+COMPRESSION_CACHE_BYTES = int(os.getenv("COMPRESSION_CACHE_BYTES", 32 * 1024 * 1024))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 5))
+ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3))
+
+
+def gzip_compressor(level: int) -> Callable[[bytes], bytes]:
+    return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def brotli_compressor(quality: int) -> Callable[[bytes], bytes]:
+    return lambda data: brotli.compress(data, quality=quality)
+
+
+def zstd_compressor(level: int) -> Callable[[bytes], bytes]:
+    return lambda data: zstandard.ZstdCompressor(level=level).compress(data)
+
+
+# In order of preference when the client accepts several equally.
+ENCODINGS = {}
+if zstandard is not None:
+    ENCODINGS["zstd"] = zstd_compressor(ZSTD_LEVEL)
+if brotli is not None:
+    ENCODINGS["br"] = brotli_compressor(BROTLI_QUALITY)
+ENCODINGS["gzip"] = gzip_compressor(GZIP_LEVEL)
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """The preferred encoding acceptable to the client, if any."""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    candidates = [
+        (weights.get(name, weights.get("*", 0)), -index, name)
+        for index, name in enumerate(ENCODINGS)
+    ]
+    quality, _, name = max(candidates)
+    return name if quality > 0 else None
+
+
+class CpuBudget:
+    """Token bucket of CPU seconds, refilled at ``rate`` seconds per second."""
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 0.1)
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            return self._tokens > 0
+
+    def spend(self, seconds: float) -> None:
+        with self._lock:
+            self._tokens -= seconds
+
+
+class CompressedCache:
+    """LRU of compressed bodies keyed by body digest and encoding."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._size = 0
+        self._entries: OrderedDict[tuple[bytes, str], bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple[bytes, str]) -> bytes | None:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key: tuple[bytes, str], data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+budget = CpuBudget(COMPRESSION_CPU_BUDGET)
+cache = CompressedCache(COMPRESSION_CACHE_BYTES)
+
+
+def compress(encoding: str, body: bytes) -> bytes | None:
+    """Compress ``body`` if the CPU budget allows, charging it the cost."""
+    if not budget.available():
+        return None
+    started = time.thread_time()
+    data = ENCODINGS[encoding](body)
+    budget.spend(time.thread_time() - started)
+    return data
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        streaming = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, streaming
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if streaming or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            if message.get("more_body", False):
+                # Streamed responses are passed through untouched.
+                streaming = True
+                await send(start)
+                await send(message)
+                return
+            await self._send(scope, start, message.get("body", b""), encoding, send)
+
+        await self.app(scope, receive, send_compressed)
+
+    def _skip(self, start: Message) -> bool:
+        headers = Headers(raw=start["headers"])
+        content_type = headers.get("content-type", "")
+        return "content-encoding" in headers or content_type.startswith(
+            "text/event-stream"
+        )
+
+    async def _send(
+        self, scope: Scope, start: Message, body: bytes, encoding: str, send: Send
+    ) -> None:
+        data = None
+        if len(body) >= self.minimum_size and not self._skip(start):
+            cacheable = scope["method"] == "GET" and start["status"] == 200
+            key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+            data = cache.get(key) if cacheable else None
+            if data is None:
+                data = await run_in_threadpool(compress, encoding, body)
+                if data is not None and cacheable:
+                    cache.put(key, data)
+
+        headers = MutableHeaders(raw=start["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        if data is not None and len(data) < len(body):
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(data))
+            # A strong ETag must change with the encoding; the version
+            # comparison of If-Match accepts the weak form.
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            body = data
+        await send(start)
+        await send({"type": "http.response.body", "body": body})
+
+
+def sample_page(posts: int = 100) -> bytes:
+    return json.dumps(
+        [
+            {
+                "title": f"Post number {index}",
+                "text": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. "
+                * (1 + index % 4),
+                "auto_reply": index % 3 == 0,
+                "auto_reply_time": 0,
+                "id": 7180000000000000000 + index * 4096,
+                "author_id": index % 17,
+                "date_time_created": f"2024-05-{1 + index % 28:02d}T12:{index % 60:02d}:00",
+                "is_blocked": False,
+                "moderation_status": "approved",
+                "version": 1,
+            }
+            for index in range(posts)
+        ]
+    ).encode()
+
+
+def benchmark(body: bytes, repeat: int) -> list[dict]:
+    levels = [("gzip", level, gzip_compressor(level)) for level in (1, 6, 9)]
+    if brotli is not None:
+        levels += [
+            ("br", quality, brotli_compressor(quality)) for quality in (1, 5, 11)
+        ]
+    if zstandard is not None:
+        levels += [("zstd", level, zstd_compressor(level)) for level in (1, 3, 19)]
+
+    results = []
+    for name, level, compressor in levels:
+        started = time.process_time()
+        for _ in range(repeat):
+            data = compressor(body)
+        seconds = (time.process_time() - started) / repeat
+        results.append(
+            {
+                "encoding": name,
+                "level": level,
+                "bytes": len(data),
+                "saved": 1 - len(data) / len(body),
+                "cpu_ms": seconds * 1000,
+                "cpu_ms_per_mb": seconds * 1000 / (len(body) / 1024 / 1024),
+            }
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark response compression")
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    body = sample_page(args.posts)
+    print(f"identity: {len(body)} bytes")
+    print(
+        f"{'encoding':<8} {'level':>5} {'bytes':>8} {'saved':>6} {'cpu ms':>7} {'ms/MB':>7}"
+    )
+    for result in benchmark(body, args.repeat):
+        print(
+            f"{result['encoding']:<8} {result['level']:>5} {result['bytes']:>8} "
+            f"{result['saved']:>6.1%} {result['cpu_ms']:>7.2f} "
+            f"{result['cpu_ms_per_mb']:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
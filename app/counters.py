@@ -0,0 +1,416 @@
+"""Row counts kept up to date by the writes that change them.
+
+The ``counters`` table holds the number of posts, of comments, and of the
+comments of every post, each with the number of blocked ones, counting what
+the list endpoints show: rows that are not deleted, including archived
+comments, excluding the comments of deleted posts. Every write adds its
+change in the same transaction as the row itself, so reading a total is a
+lookup of a few rows instead of a ``COUNT(*)`` scan. Each counter is split
+over ``COUNTER_STRIPES`` rows written at random so concurrent writers do not
+queue on a single row; reading sums them.
+
+The ``author_stats`` table keeps the same counts, and the time of the latest
+post or comment, per author.
+
+Comment counts live next to the comments, on every shard. A reconciliation
+job (``python -m app.counters``, or every ``COUNTER_RECONCILE_INTERVAL``
+seconds when ``RUN_COUNTER_RECONCILIATION=1``) recounts the rows and corrects
+any drift, e.g. from writes racing a post deletion or from rebalancing. The
+comments of a deleted post only leave their authors' stats at that point.
+"""
+
+import logging
+import os
+import random
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import case, delete, func, literal, or_, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import archive
+from db import models, sharding
+from db.engine import SessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+COUNTER_STRIPES = int(os.getenv("COUNTER_STRIPES", 8))
+COUNTER_RECONCILE_INTERVAL = float(os.getenv("COUNTER_RECONCILE_INTERVAL", 3600))
+RUN_COUNTER_RECONCILIATION = os.getenv("RUN_COUNTER_RECONCILIATION", "0") == "1"
+
+POSTS = "posts"
+COMMENTS = "comments"
+POST_COMMENTS = "post_comments"
+
+
+def _insert(session: Session):
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+def add(
+    session: Session, name: str, post_id: int = 0, total: int = 0, blocked: int = 0
+) -> None:
+    """Add to a counter as part of the session's current transaction."""
+    if not total and not blocked:
+        return
+    counter = models.Counter
+    statement = _insert(session)(counter).values(
+        name=name,
+        post_id=post_id,
+        stripe=random.randrange(COUNTER_STRIPES),
+        total=total,
+        blocked=blocked,
+    )
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[counter.name, counter.post_id, counter.stripe],
+            set_={
+                "total": counter.total + statement.excluded.total,
+                "blocked": counter.blocked + statement.excluded.blocked,
+            },
+        )
+    )
+
+
+def add_author(
+    session: Session,
+    model,
+    author_id: int,
+    total: int = 0,
+    blocked: int = 0,
+    active_at: datetime | None = None,
+) -> None:
+    """Add to the post or comment counts of an author's stats."""
+    if not total and not blocked and active_at is None:
+        return
+    stats = models.AuthorStats
+    if model is models.Post:
+        total_column, blocked_column = "posts", "blocked_posts"
+    else:
+        total_column, blocked_column = "comments", "blocked_comments"
+    statement = _insert(session)(stats).values(
+        author_id=author_id,
+        last_active_at=active_at,
+        **{total_column: total, blocked_column: blocked},
+    )
+    changes = {
+        total_column: getattr(stats, total_column) + statement.excluded[total_column],
+        blocked_column: getattr(stats, blocked_column)
+        + statement.excluded[blocked_column],
+    }
+    if active_at is not None:
+        changes["last_active_at"] = case(
+            (
+                or_(
+                    stats.last_active_at.is_(None),
+                    stats.last_active_at < statement.excluded.last_active_at,
+                ),
+                statement.excluded.last_active_at,
+            ),
+            else_=stats.last_active_at,
+        )
+    session.execute(
+        statement.on_conflict_do_update(index_elements=[stats.author_id], set_=changes)
+    )
+
+
+def count(
+    session: Session,
+    model,
+    post_id: int | None,
+    author_id: int | None,
+    total: int = 0,
+    blocked: int = 0,
+    active_at: datetime | None = None,
+) -> None:
+    """Count posts, or comments of ``post_id``, added, removed or (un)blocked."""
+    if model is models.Post:
+        add(session, POSTS, total=total, blocked=blocked)
+    else:
+        add(session, COMMENTS, total=total, blocked=blocked)
+        add(session, POST_COMMENTS, post_id, total=total, blocked=blocked)
+    if author_id is not None:
+        add_author(session, model, author_id, total, blocked, active_at)
+
+
+def forget_post(session: Session, post_id: int) -> None:
+    """Drop the comments of a deleted post from the comment counters."""
+    counter = models.Counter
+    total, blocked = read(session, POST_COMMENTS, post_id)
+    add(session, COMMENTS, total=-total, blocked=-blocked)
+    session.execute(
+        delete(counter).where(counter.name == POST_COMMENTS, counter.post_id == post_id)
+    )
+
+
+def read(session: Session, name: str, post_id: int = 0) -> tuple[int, int]:
+    """``(total, blocked)`` of a counter."""
+    counter = models.Counter
+    total, blocked = session.execute(
+        select(
+            func.coalesce(func.sum(counter.total), 0),
+            func.coalesce(func.sum(counter.blocked), 0),
+        ).where(counter.name == name, counter.post_id == post_id)
+    ).one()
+    return total, blocked
+
+
+def total_posts(db: Session) -> int:
+    return read(db, POSTS)[0]
+
+
+def total_comments(db: Session, post_id: int | None = None) -> int:
+    if post_id:
+        with sharding.comment_session(db, post_id) as session:
+            return read(session, POST_COMMENTS, post_id)[0]
+    return sum(total for total, _ in sharding.fan_out(db, lambda s: read(s, COMMENTS)))
+
+
+def author_stats(db: Session, author_id: int) -> dict:
+    """The stats of an author, with comment counts summed over all shards."""
+
+    def read_stats(session: Session) -> models.AuthorStats | None:
+        return session.execute(
+            select(models.AuthorStats).where(models.AuthorStats.author_id == author_id)
+        ).scalar()
+
+    main = read_stats(db)
+    shards = [row for row in sharding.fan_out(db, read_stats) if row is not None]
+    activity = [
+        row.last_active_at
+        for row in [main, *shards]
+        if row is not None and row.last_active_at is not None
+    ]
+    return {
+        "posts": main.posts if main else 0,
+        "blocked_posts": main.blocked_posts if main else 0,
+        "comments": sum(row.comments for row in shards),
+        "blocked_comments": sum(row.blocked_comments for row in shards),
+        "last_active_at": max(activity, default=None),
+    }
+
+
+def _compare(session: Session, exact, counted) -> dict[int, list[int]]:
+    """Run two ``(key, total, blocked)`` queries in one statement.
+
+    Returns ``{key: [exact total, exact blocked, counted total, counted
+    blocked]}``; both sides come from the same snapshot.
+    """
+    exact, counted = exact.subquery(), counted.subquery()
+    rows = union_all(
+        select(
+            exact.c[0].label("key"),
+            exact.c[1].label("exact_total"),
+            exact.c[2].label("exact_blocked"),
+            literal(0).label("counted_total"),
+            literal(0).label("counted_blocked"),
+        ),
+        select(counted.c[0], literal(0), literal(0), counted.c[1], counted.c[2]),
+    ).subquery()
+    return {
+        key: list(sums)
+        for key, *sums in session.execute(
+            select(
+                rows.c.key,
+                func.sum(rows.c.exact_total),
+                func.sum(rows.c.exact_blocked),
+                func.sum(rows.c.counted_total),
+                func.sum(rows.c.counted_blocked),
+            ).group_by(rows.c.key)
+        )
+    }
+
+
+def _add_exact(rows: dict[int, list[int]], exact: dict[int, list[int]]) -> None:
+    for key, (total, blocked) in exact.items():
+        counts = rows.setdefault(key, [0, 0, 0, 0])
+        counts[0] += total
+        counts[1] += blocked
+
+
+def _drift(counts: list[int]) -> tuple[int, int]:
+    """What to add to a counter to make it exact."""
+    return counts[0] - counts[2], counts[1] - counts[3]
+
+
+def reconcile(db: Session) -> int:
+    """Recount every counter and correct it; returns how many were off.
+
+    Each group of counters is recounted in a single statement that also
+    reads them, so both come from one snapshot; only the difference is
+    added, and writes made meanwhile keep their own increments.
+    """
+    post, counter, stats = models.Post, models.Counter, models.AuthorStats
+    live = post.deleted_at.is_(None)
+    corrected = 0
+
+    rows = _compare(
+        db,
+        select(literal(0), func.count(), func.count().filter(post.is_blocked)).where(
+            live
+        ),
+        select(counter.post_id, counter.total, counter.blocked).where(
+            counter.name == POSTS
+        ),
+    )
+    total, blocked = _drift(rows[0])
+    add(db, POSTS, total=total, blocked=blocked)
+    corrected += bool(total or blocked)
+
+    rows = _compare(
+        db,
+        select(post.author_id, func.count(), func.count().filter(post.is_blocked))
+        .where(live, post.author_id.is_not(None))
+        .group_by(post.author_id),
+        select(stats.author_id, stats.posts, stats.blocked_posts),
+    )
+    for author_id, counts in rows.items():
+        total, blocked = _drift(counts)
+        add_author(db, post, author_id, total, blocked)
+        corrected += bool(total or blocked)
+    db.commit()
+
+    from app import crud
+
+    by_post = archive.archive.post_counts()
+    by_author = archive.archive.author_counts()
+    archived_post_ids = set(by_post) - crud.hidden_post_ids_among(db, set(by_post))
+
+    with sharding.comment_sessions(db) as sessions:
+        for index, session in enumerate(sessions):
+
+            def on_shard(post_id: int) -> bool:
+                return post_id in archived_post_ids and (
+                    len(sessions) == 1 or sharding.shard_for(post_id) == index
+                )
+
+            archived_by_post = {
+                post_id: counts
+                for post_id, counts in by_post.items()
+                if on_shard(post_id)
+            }
+            archived_by_author = {}
+            for author_id, per_post in by_author.items():
+                for post_id, (total, blocked) in per_post.items():
+                    if on_shard(post_id):
+                        counts = archived_by_author.setdefault(author_id, [0, 0])
+                        counts[0] += total
+                        counts[1] += blocked
+            corrected += _reconcile_comments(
+                db, session, archived_by_post, archived_by_author
+            )
+    return corrected
+
+
+def _reconcile_comments(
+    db: Session,
+    session: Session,
+    archived_by_post: dict[int, list[int]],
+    archived_by_author: dict[int, list[int]],
+) -> int:
+    """Reconcile the comment counters of one comment shard.
+
+    Comments of deleted posts are skipped with a join against the posts
+    table; a shard cannot join it, so there they are counted and then taken
+    out again for the deleted posts found among the counted ones.
+    """
+    from app import crud
+
+    comment, counter, stats = models.Comment, models.Counter, models.AuthorStats
+    live = [comment.deleted_at.is_(None), *crud.live_post_conditions()]
+    blocked_count = func.count().filter(comment.is_blocked)
+    corrected = 0
+
+    rows = _compare(
+        session,
+        select(comment.post_id, func.count(), blocked_count)
+        .where(*live)
+        .group_by(comment.post_id),
+        select(counter.post_id, counter.total, counter.blocked).where(
+            counter.name.in_([COMMENTS, POST_COMMENTS])
+        ),
+    )
+    # Without a shard only posts left with no counted comment can be deleted.
+    hidden_post_ids = sorted(
+        crud.hidden_post_ids_among(
+            db,
+            {
+                post_id
+                for post_id, counts in rows.items()
+                if post_id and (sharding.shard_sessions or not any(counts[:2]))
+            },
+        )
+    )
+    for post_id in hidden_post_ids:
+        del rows[post_id]
+    _add_exact(rows, archived_by_post)
+    # The overall counter is stored under post id 0, which no post has.
+    overall = rows.pop(0, [0, 0, 0, 0])
+    overall[0] = sum(counts[0] for counts in rows.values())
+    overall[1] = sum(counts[1] for counts in rows.values())
+    total, blocked = _drift(overall)
+    add(session, COMMENTS, total=total, blocked=blocked)
+    corrected += bool(total or blocked)
+    for post_id, counts in rows.items():
+        total, blocked = _drift(counts)
+        add(session, POST_COMMENTS, post_id, total=total, blocked=blocked)
+        corrected += bool(total or blocked)
+    for start in range(0, len(hidden_post_ids), crud.POST_ID_BATCH_SIZE):
+        session.execute(
+            delete(counter).where(
+                counter.name == POST_COMMENTS,
+                counter.post_id.in_(
+                    hidden_post_ids[start : start + crud.POST_ID_BATCH_SIZE]
+                ),
+            )
+        )
+
+    rows = _compare(
+        session,
+        select(comment.author_id, func.count(), blocked_count)
+        .where(*live, comment.author_id.is_not(None))
+        .group_by(comment.author_id),
+        select(stats.author_id, stats.comments, stats.blocked_comments),
+    )
+    _add_exact(rows, archived_by_author)
+    if sharding.shard_sessions:
+        for start in range(0, len(hidden_post_ids), crud.POST_ID_BATCH_SIZE):
+            for author_id, total, blocked in session.execute(
+                select(comment.author_id, func.count(), blocked_count)
+                .where(
+                    comment.deleted_at.is_(None),
+                    comment.author_id.is_not(None),
+                    comment.post_id.in_(
+                        hidden_post_ids[start : start + crud.POST_ID_BATCH_SIZE]
+                    ),
+                )
+                .group_by(comment.author_id)
+            ):
+                rows[author_id][0] -= total
+                rows[author_id][1] -= blocked
+    for author_id, counts in rows.items():
+        total, blocked = _drift(counts)
+        add_author(session, comment, author_id, total, blocked)
+        corrected += bool(total or blocked)
+    session.commit()
+    return corrected
+
+
+def run_reconciliation() -> None:
+    db = SessionLocal()
+    try:
+        corrected = reconcile(db)
+    finally:
+        db.close()
+    if corrected:
+        logger.info("Corrected %s drifted counters", corrected)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_reconciliation()
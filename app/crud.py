@@ -1,32 +1,73 @@
-import os
-from datetime import datetime
+from datetime import datetime, timezone
 
-import requests
-from dotenv import load_dotenv
-from sqlalchemy import select, func, case
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func, case, update, Row
+from sqlalchemy.orm import Session, load_only
 
 from AI.ai_tools import generate_comment_reply
-from app import schemas
-from db import models
+from app import archive, counters, schemas, events, feed, moderation, spam, trending
+from db import models, sharding
 
-load_dotenv()
+# Bound on the post ids sent in one ``IN (...)`` list.
+POST_ID_BATCH_SIZE = 500
 
-PROFANITY_FILTER_API = "https://api.api-ninjas.com/v1/profanityfilter?text={}"
 
+class VersionConflictError(Exception):
+    pass
 
-def get_all_posts(db: Session) -> list[models.Post]:
-    return db.execute(select(models.Post)).scalars().all()
 
+class ArchivedCommentError(Exception):
+    pass
 
-def create_post(db: Session, post: schemas.PostCreate, author_id: int) -> models.Post:
-    response = requests.get(
-        PROFANITY_FILTER_API.format(f"{post.title} {post.text}"),
-        headers={"X-Api-Key": os.getenv("API_NINJAS_KEY")},
+
+class PostNotFoundError(Exception):
+    pass
+
+
+def newest_first(queryset, model, cursor: int | None, limit: int | None):
+    """Page ``queryset`` newest first by primary key when a limit is given.
+
+    Ids grow with creation time, so the page after ``cursor`` is a plain
+    range scan of the primary key index.
+    """
+    if limit is None:
+        return queryset
+    if cursor is not None:
+        queryset = queryset.filter(model.id < cursor)
+    return queryset.order_by(model.id.desc()).limit(limit)
+
+
+def load_fields(model, fields: list[str] | None) -> list:
+    """Loader options that only fetch the columns behind ``fields``."""
+    if fields is None:
+        return []
+    return [load_only(*(getattr(model, field) for field in fields))]
+
+
+def get_all_posts(
+    db: Session,
+    viewer_id: int | None = None,
+    cursor: int | None = None,
+    limit: int | None = None,
+    fields: list[str] | None = None,
+    author_id: int | None = None,
+) -> list[models.Post]:
+    queryset = (
+        select(models.Post)
+        .options(*load_fields(models.Post, fields))
+        .where(
+            models.Post.deleted_at.is_(None),
+            moderation.visible_to(models.Post, viewer_id),
+        )
+    )
+    if author_id is not None:
+        queryset = queryset.where(models.Post.author_id == author_id)
+    return (
+        db.execute(newest_first(queryset, models.Post, cursor, limit)).scalars().all()
     )
-    is_blocked = False
-    if response.status_code == 200:
-        is_blocked = response.json()["has_profanity"]
+
+
+def create_post(db: Session, post: schemas.PostCreate, author_id: int) -> models.Post:
+    is_blocked, moderation_status = moderation.moderate(f"{post.title} {post.text}")
     db_post = models.Post(
         author_id=author_id,
         title=post.title,
@@ -34,142 +75,622 @@ def create_post(db: Session, post: schemas.PostCreate, author_id: int) -> models
         auto_reply=post.auto_reply,
         auto_reply_time=post.auto_reply_time,
         is_blocked=is_blocked,
+        moderation_status=moderation_status,
     )
     db.add(db_post)
+    counters.count(
+        db,
+        models.Post,
+        None,
+        author_id,
+        total=1,
+        blocked=int(is_blocked),
+        active_at=datetime.utcnow(),
+    )
     db.commit()
     db.refresh(db_post)
+    feed.fan_out_post(db, db_post)
     return db_post
 
 
-def get_post_by_id(db: Session, post_id: int) -> models.Post | None:
-    return db.execute(select(models.Post).where(models.Post.id == post_id)).scalar()
+def get_post_by_id(
+    db: Session,
+    post_id: int,
+    viewer_id: int | None = None,
+    fields: list[str] | None = None,
+) -> models.Post | None:
+    return db.execute(
+        select(models.Post)
+        .options(*load_fields(models.Post, fields))
+        .where(
+            models.Post.id == post_id,
+            models.Post.deleted_at.is_(None),
+            moderation.visible_to(models.Post, viewer_id),
+        )
+    ).scalar()
 
 
 def update_post(
-    db: Session, post_id: int, post: schemas.PostCreate
-) -> models.Post | None:
-    response = requests.get(
-        PROFANITY_FILTER_API.format(f"{post.title} {post.text}"),
-        headers={"X-Api-Key": os.getenv("API_NINJAS_KEY")},
-    )
-    is_blocked = False
-    if response.status_code == 200:
-        is_blocked = response.json()["has_profanity"]
-    db_post = get_post_by_id(db=db, post_id=post_id)
-    db_post.title = post.title
-    db_post.text = post.text
-    db_post.auto_reply = post.auto_reply
-    db_post.auto_reply_time = post.auto_reply_time
-    db_post.is_blocked = is_blocked
+    db: Session, post_id: int, post: schemas.PostCreate, version: int | None = None
+) -> Row | None:
+    """Update a post in one ``UPDATE ... RETURNING`` statement.
+
+    When ``version`` is given the update only applies if the stored version
+    still matches, otherwise ``VersionConflictError`` is raised.
+    """
+    is_blocked, moderation_status = moderation.moderate(f"{post.title} {post.text}")
+    conditions = [models.Post.id == post_id, models.Post.deleted_at.is_(None)]
+    if version is not None:
+        conditions.append(models.Post.version == version)
+
+    statement = (
+        update(models.Post)
+        .values(
+            title=post.title,
+            text=post.text,
+            auto_reply=post.auto_reply,
+            auto_reply_time=post.auto_reply_time,
+            is_blocked=is_blocked,
+            moderation_status=moderation_status,
+            version=models.Post.version + 1,
+        )
+        .returning(*models.Post.__table__.columns)
+        .execution_options(synchronize_session=False)
+    )
+    db_post = update_counted(db, models.Post, statement, conditions, is_blocked)
     db.commit()
-    db.refresh(db_post)
+
+    if db_post is None and version is not None:
+        if get_post_by_id(db=db, post_id=post_id) is not None:
+            raise VersionConflictError
     return db_post
 
 
-def delete_post(db: Session, post_id: int) -> None:
-    db_post = get_post_by_id(db=db, post_id=post_id)
-    db.delete(db_post)
+def update_counted(
+    session: Session, model, statement, conditions: list, is_blocked: bool
+) -> Row | None:
+    """Run an ``UPDATE ... RETURNING`` that sets ``is_blocked``, counting flips.
+
+    ``conditions`` select a single row. The statement also returns the
+    blocked state it had before, read by a materialized CTE that is
+    evaluated ahead of the update, so the counters only change when it
+    flipped and no extra statement is needed.
+    """
+    old = (
+        select(model.id, model.is_blocked)
+        .where(*conditions)
+        .with_for_update()
+        .cte("old")
+        .prefix_with("MATERIALIZED")
+    )
+    row = session.execute(
+        statement.where(*conditions, model.id.in_(select(old.c.id))).returning(
+            select(old.c.is_blocked).scalar_subquery().label("was_blocked")
+        )
+    ).first()
+    if row is not None and bool(row.was_blocked) != is_blocked:
+        counters.count(
+            session,
+            model,
+            getattr(row, "post_id", None),
+            row.author_id,
+            blocked=1 if is_blocked else -1,
+        )
+    return row
+
+
+def delete_post(db: Session, post_id: int) -> bool:
+    """Soft delete a post; its comments are hidden with it and purged later."""
+    deleted = db.execute(
+        update(models.Post)
+        .where(models.Post.id == post_id, models.Post.deleted_at.is_(None))
+        .values(deleted_at=datetime.utcnow())
+        .returning(models.Post.author_id, models.Post.is_blocked)
+    ).first()
+    if deleted is None:
+        db.commit()
+        return False
+
+    counters.count(
+        db,
+        models.Post,
+        None,
+        deleted.author_id,
+        total=-1,
+        blocked=-int(deleted.is_blocked),
+    )
+    # Unless comments are sharded this is the same transaction.
+    with sharding.comment_session(db, post_id) as session:
+        counters.forget_post(session, post_id)
+        session.commit()
     db.commit()
+    return True
+
+
+def get_trending_posts(
+    db: Session, viewer_id: int | None = None, limit: int = 20
+) -> list[tuple[models.Post, float]]:
+    """The ``limit`` best ranked visible posts with their current scores."""
+    ranked = trending.ranking.top(trending.TRENDING_TOP_K)
+    posts = {
+        post.id: post
+        for post in db.execute(
+            select(models.Post).where(
+                models.Post.id.in_([post_id for post_id, _ in ranked]),
+                models.Post.deleted_at.is_(None),
+                moderation.visible_to(models.Post, viewer_id),
+            )
+        ).scalars()
+    }
+    trending_posts = [
+        (posts[post_id], score) for post_id, score in ranked if post_id in posts
+    ]
+    return trending_posts[:limit]
+
+
+def publish_comment_event(event_type: str, db_comment: models.Comment | Row) -> None:
+    """Publish a created or updated comment if everyone may see it."""
+    if not moderation.is_public(db_comment):
+        return
+    data = schemas.Comment.model_validate(db_comment, from_attributes=True)
+    events.broker.publish(
+        events.comment_channel(db_comment.post_id),
+        event_type,
+        data.model_dump(mode="json"),
+    )
 
 
-def get_all_comments(db: Session, post_id: int | None = None) -> list[models.Comment]:
-    queryset = db.query(models.Comment)
+def record_trending(db_comment: models.Comment | Row, delta: int = 1) -> None:
+    """Count an approved comment for (or against) its post in the ranking."""
+    trending.ranking.record(
+        db_comment.post_id,
+        db_comment.date_time_created.replace(tzinfo=timezone.utc).timestamp(),
+        delta=delta,
+    )
+
+
+def live_post_conditions() -> list:
+    """Conditions hiding the comments of deleted posts in SQL.
+
+    Only comments stored next to the posts can be checked this way; sharded
+    comments are filtered afterwards with ``without_hidden_posts``.
+    """
+    if sharding.shard_sessions:
+        return []
+    return [
+        select(models.Post.id)
+        .where(
+            models.Post.id == models.Comment.post_id,
+            models.Post.deleted_at.is_(None),
+        )
+        .exists()
+    ]
+
+
+def visible_comments(queryset, viewer_id: int | None = None):
+    return queryset.filter(
+        models.Comment.deleted_at.is_(None),
+        *live_post_conditions(),
+        moderation.visible_to(models.Comment, viewer_id),
+    )
+
+
+def hidden_post_ids_among(db: Session, post_ids: set[int]) -> set[int]:
+    """The ones of ``post_ids`` that are deleted or already purged."""
+    post_ids, live = set(post_ids), set()
+    ordered = sorted(post_ids)
+    for start in range(0, len(ordered), POST_ID_BATCH_SIZE):
+        live.update(
+            db.execute(
+                select(models.Post.id).where(
+                    models.Post.id.in_(ordered[start : start + POST_ID_BATCH_SIZE]),
+                    models.Post.deleted_at.is_(None),
+                )
+            ).scalars()
+        )
+    return post_ids - live
 
-    if post_id:
-        queryset = queryset.filter(models.Comment.post_id == post_id)
 
-    return queryset.all()
+def without_hidden_posts(db: Session, rows: list) -> list:
+    """Drop the ``rows`` whose post is deleted, checking only their own posts."""
+    if not rows:
+        return rows
+    hidden = hidden_post_ids_among(db, {row.post_id for row in rows})
+    return [row for row in rows if row.post_id not in hidden]
+
+
+def check_not_archived(db: Session, comment_id: int) -> None:
+    """Raise if ``comment_id`` was archived, which makes it read-only."""
+    archived = archive.archive.get(comment_id)
+    if archived is not None and not hidden_post_ids_among(db, {archived.post_id}):
+        raise ArchivedCommentError
+
+
+def find_comment_post_id(db: Session, comment_id: int) -> int | None:
+    """The post of a live sharded comment, which tells which shard holds it."""
+
+    def query(session: Session) -> int | None:
+        return session.execute(
+            select(models.Comment.post_id).where(
+                models.Comment.id == comment_id, models.Comment.deleted_at.is_(None)
+            )
+        ).scalar()
+
+    return next(
+        (post_id for post_id in sharding.fan_out(db, query) if post_id is not None),
+        None,
+    )
+
+
+def merge_pages(pages: list[list], limit: int | None) -> list:
+    if len(pages) == 1:
+        return pages[0]
+    # On duplicate ids the earlier page wins, so live rows shadow archived ones.
+    unique = {}
+    for page in reversed(pages):
+        unique.update((row.id, row) for row in page)
+    merged = sorted(unique.values(), key=lambda row: row.id, reverse=limit is not None)
+    return merged[:limit]
+
+
+def get_all_comments(
+    db: Session,
+    post_id: int | None = None,
+    viewer_id: int | None = None,
+    cursor: int | None = None,
+    limit: int | None = None,
+    fields: list[str] | None = None,
+    author_id: int | None = None,
+) -> list[models.Comment]:
+    sharded = bool(sharding.shard_sessions)
+    if post_id and sharded and hidden_post_ids_among(db, {post_id}):
+        return []
+
+    def query(session: Session, cursor: int | None) -> list[models.Comment]:
+        queryset = visible_comments(
+            session.query(models.Comment).options(*load_fields(models.Comment, fields)),
+            viewer_id,
+        )
+        if post_id:
+            queryset = queryset.filter(models.Comment.post_id == post_id)
+        if author_id is not None:
+            queryset = queryset.filter(models.Comment.author_id == author_id)
+        return newest_first(queryset, models.Comment, cursor, limit).all()
+
+    comments, page_cursor = [], cursor
+    while True:
+        if post_id:
+            with sharding.comment_session(db, post_id) as session:
+                page = query(session, page_cursor)
+        else:
+            page = merge_pages(
+                sharding.fan_out(db, lambda session: query(session, page_cursor)),
+                limit,
+            )
+        # Sharded comments of deleted posts are dropped here, so a page may
+        # come up short and is topped up from the next one.
+        comments += without_hidden_posts(db, page) if sharded and not post_id else page
+        if limit is None or len(comments) >= limit or len(page) < limit:
+            break
+        page_cursor = page[-1].id
+    comments = comments[:limit]
+
+    # Archived comments are older than live ones, so a full page only needs
+    # the archive when the archive still holds higher ids.
+    if (
+        limit is None
+        or len(comments) < limit
+        or comments[-1].id < archive.archive.max_id()
+    ):
+        archived = archive.archive.comments(
+            post_id,
+            cursor,
+            archive.ARCHIVE_UNPAGED_LIMIT if limit is None else limit,
+            exclude=lambda post_ids: hidden_post_ids_among(db, post_ids),
+            author_id=author_id,
+        )
+        if archived:
+            comments = merge_pages([comments, archived], limit)
+    return comments
 
 
 def create_comment(
     db: Session, comment: schemas.CommentCreate, author_id: int
 ) -> models.Comment:
-    response = requests.get(
-        PROFANITY_FILTER_API.format(comment.text),
-        headers={"X-Api-Key": os.getenv("API_NINJAS_KEY")},
-    )
-    is_blocked = False
-    if response.status_code == 200:
-        is_blocked = response.json()["has_profanity"]
+    post = get_post_by_id(db=db, post_id=comment.post_id)
+    if post is None:
+        raise PostNotFoundError
+    # Floods are caught before the profanity API and the auto reply run.
+    if spam.index.is_flood(author_id, comment.text):
+        if spam.SPAM_ACTION == "reject":
+            raise spam.SpamDetected
+        is_blocked, moderation_status = True, moderation.BLOCKED
+    else:
+        is_blocked, moderation_status = moderation.moderate(comment.text)
 
     db_comment = models.Comment(
         author_id=author_id,
         text=comment.text,
         post_id=comment.post_id,
         is_blocked=is_blocked,
+        moderation_status=moderation_status,
     )
-    post = get_post_by_id(db=db, post_id=comment.post_id)
-    db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
-
-    if post.auto_reply and not comment.is_blocked and not post.is_blocked:
-        reply = models.Comment(
-            author_id=post.author_id,
-            text=generate_comment_reply(comment.text, post.text),
-            post_id=post.id,
+    with sharding.comment_session(db, comment.post_id) as session:
+        session.add(db_comment)
+        counters.count(
+            session,
+            models.Comment,
+            comment.post_id,
+            author_id,
+            total=1,
+            blocked=int(is_blocked),
+            active_at=datetime.utcnow(),
         )
-        db.add(reply)
-        db.commit()
+        session.commit()
+        session.refresh(db_comment)
+    publish_comment_event("comment.created", db_comment)
+    # Pending comments count once the moderation worker approves them.
+    if db_comment.moderation_status == moderation.APPROVED:
+        record_trending(db_comment)
+        create_auto_reply(db, post=post, db_comment=db_comment)
 
     return db_comment
 
 
-def get_comment_by_id(db: Session, comment_id: int) -> models.Comment | None:
-    return db.execute(
-        select(models.Comment).where(models.Comment.id == comment_id)
-    ).scalar()
+def create_auto_reply(
+    db: Session, post: models.Post, db_comment: models.Comment | Row
+) -> None:
+    if not post.auto_reply or db_comment.is_blocked or post.is_blocked:
+        return
+
+    reply = models.Comment(
+        author_id=post.author_id,
+        text=generate_comment_reply(db_comment.text, post.text),
+        post_id=post.id,
+    )
+    with sharding.comment_session(db, post.id) as session:
+        session.add(reply)
+        counters.count(
+            session,
+            models.Comment,
+            post.id,
+            post.author_id,
+            total=1,
+            active_at=datetime.utcnow(),
+        )
+        session.commit()
+        session.refresh(reply)
+    publish_comment_event("comment.created", reply)
+    # Replies are approved comments like any other, and leave the ranking
+    # the same way when deleted.
+    record_trending(reply)
+
+
+def get_comment_by_id(
+    db: Session,
+    comment_id: int,
+    viewer_id: int | None = None,
+    fields: list[str] | None = None,
+) -> models.Comment | None:
+    def query(session: Session) -> models.Comment | None:
+        queryset = select(models.Comment).options(*load_fields(models.Comment, fields))
+        return session.execute(
+            visible_comments(queryset, viewer_id).where(models.Comment.id == comment_id)
+        ).scalar()
+
+    db_comment = next(filter(None, sharding.fan_out(db, query)), None)
+    if db_comment is not None and not sharding.shard_sessions:
+        return db_comment
+    if db_comment is None:
+        db_comment = archive.archive.get(comment_id)
+    if db_comment and hidden_post_ids_among(db, {db_comment.post_id}):
+        return None
+    return db_comment
 
 
 def update_comment(
-    db: Session, comment_id: int, comment: schemas.CommentCreate
-) -> models.Comment | None:
-    response = requests.get(
-        PROFANITY_FILTER_API.format(comment.text),
-        headers={"X-Api-Key": os.getenv("API_NINJAS_KEY")},
-    )
-    is_blocked = False
-    if response.status_code == 200:
-        is_blocked = response.json()["has_profanity"]
-    db_comment = get_comment_by_id(db=db, comment_id=comment_id)
-    db_comment.text = comment.text
-    db_comment.is_blocked = is_blocked
-    db.commit()
-    db.refresh(db_comment)
+    db: Session,
+    comment_id: int,
+    comment: schemas.CommentCreate,
+    version: int | None = None,
+) -> Row | None:
+    is_blocked, moderation_status = moderation.moderate(comment.text)
+    conditions = [
+        models.Comment.id == comment_id,
+        models.Comment.deleted_at.is_(None),
+        *live_post_conditions(),
+    ]
+    post_id = None
+    if sharding.shard_sessions:
+        post_id = find_comment_post_id(db, comment_id)
+        if post_id is None:
+            check_not_archived(db, comment_id)
+            return None
+        if hidden_post_ids_among(db, {post_id}):
+            return None
+    if version is not None:
+        conditions.append(models.Comment.version == version)
+
+    statement = (
+        update(models.Comment)
+        .values(
+            text=comment.text,
+            is_blocked=is_blocked,
+            moderation_status=moderation_status,
+            version=models.Comment.version + 1,
+        )
+        .returning(*models.Comment.__table__.columns)
+        .execution_options(synchronize_session=False)
+    )
+
+    with sharding.comment_session(db, post_id) as session:
+        db_comment = update_counted(
+            session, models.Comment, statement, conditions, is_blocked
+        )
+        session.commit()
+
+    if db_comment is None:
+        check_not_archived(db, comment_id)
+        if version is not None and get_comment_by_id(db, comment_id) is not None:
+            raise VersionConflictError
+        return None
+
+    publish_comment_event("comment.updated", db_comment)
     return db_comment
 
 
-def delete_comment(db: Session, comment_id: int) -> None:
-    db_comment = get_comment_by_id(db=db, comment_id=comment_id)
-    db.delete(db_comment)
-    db.commit()
+def delete_comment(db: Session, comment_id: int) -> bool:
+    post_id = None
+    if sharding.shard_sessions:
+        post_id = find_comment_post_id(db, comment_id)
+        if post_id is None:
+            check_not_archived(db, comment_id)
+            return False
+
+    with sharding.comment_session(db, post_id) as session:
+        deleted = session.execute(
+            update(models.Comment)
+            .where(models.Comment.id == comment_id, models.Comment.deleted_at.is_(None))
+            .values(deleted_at=datetime.utcnow(), version=models.Comment.version + 1)
+            .returning(
+                models.Comment.post_id,
+                models.Comment.author_id,
+                models.Comment.is_blocked,
+                models.Comment.moderation_status,
+                models.Comment.date_time_created,
+            )
+        ).first()
+        # The comments of deleted posts are no longer counted.
+        if deleted is not None and not hidden_post_ids_among(db, {deleted.post_id}):
+            counters.count(
+                session,
+                models.Comment,
+                deleted.post_id,
+                deleted.author_id,
+                total=-1,
+                blocked=-int(deleted.is_blocked),
+            )
+        session.commit()
+    if deleted is None:
+        check_not_archived(db, comment_id)
+        return False
+
+    if deleted.moderation_status == moderation.APPROVED:
+        record_trending(deleted, delta=-1)
+    events.broker.publish(
+        events.comment_channel(deleted.post_id),
+        "comment.deleted",
+        {"id": comment_id, "post_id": deleted.post_id},
+    )
+    return True
+
+
+def count_hidden_pending(
+    db: Session, model, viewer_id: int | None, post_id: int | None = None
+) -> int:
+    """How many of the counted posts or comments are pending and hidden from
+    ``viewer_id``.
+
+    The moderation worker keeps the pending rows few, so this is a short
+    scan of the ``moderation_status`` index.
+    """
+    if viewer_id is None or moderation.PENDING_VISIBILITY == "all":
+        return 0
+    hidden = ~moderation.visible_to(model, viewer_id)
+    if model is models.Post:
+        return db.execute(
+            select(func.count())
+            .select_from(models.Post)
+            .where(hidden, models.Post.deleted_at.is_(None))
+        ).scalar()
+
+    def query(session: Session) -> list[Row]:
+        queryset = (
+            select(models.Comment.post_id, func.count().label("count"))
+            .where(hidden, models.Comment.deleted_at.is_(None), *live_post_conditions())
+            .group_by(models.Comment.post_id)
+        )
+        if post_id:
+            queryset = queryset.where(models.Comment.post_id == post_id)
+        return session.execute(queryset).all()
+
+    if post_id:
+        with sharding.comment_session(db, post_id) as session:
+            rows = query(session)
+    else:
+        rows = [row for rows in sharding.fan_out(db, query) for row in rows]
+    if sharding.shard_sessions:
+        rows = without_hidden_posts(db, rows)
+    return sum(row.count for row in rows)
+
+
+def total_posts(db: Session, viewer_id: int | None = None) -> int:
+    """The number of posts ``viewer_id`` can list."""
+    return counters.total_posts(db) - count_hidden_pending(db, models.Post, viewer_id)
+
+
+def total_comments(
+    db: Session, viewer_id: int | None = None, post_id: int | None = None
+) -> int:
+    """The number of comments, or comments of ``post_id``, ``viewer_id`` can list."""
+    return counters.total_comments(db, post_id) - count_hidden_pending(
+        db, models.Comment, viewer_id, post_id
+    )
+
+
+def get_author_stats(db: Session, author_id: int) -> dict:
+    stats = counters.author_stats(db, author_id)
+    written = stats["posts"] + stats["comments"]
+    blocked = stats["blocked_posts"] + stats["blocked_comments"]
+    return {
+        "author_id": author_id,
+        **stats,
+        "blocked_ratio": blocked / written if written else 0.0,
+    }
 
 
 def comments_analysis(db: Session, date_from: str, date_to: str) -> list[dict]:
     date_from_dt = datetime.strptime(date_from, "%Y-%m-%d")
     date_to_dt = datetime.strptime(date_to, "%Y-%m-%d")
-
-    results = (
-        db.query(
-            func.date(models.Comment.date_time_created).label("day"),
-            func.count(models.Comment.id).label("total_comments"),
-            func.count(models.Comment.id)
-            .filter(models.Comment.is_blocked == True)
-            .label("blocked_comments"),
+    # Sharded counts are grouped by post as well, so the comments of
+    # deleted posts can be dropped by checking just the posts found.
+    by_post = [models.Comment.post_id] if sharding.shard_sessions else []
+
+    def query(session: Session) -> list[Row]:
+        return (
+            session.query(
+                func.date(models.Comment.date_time_created).label("day"),
+                func.count(models.Comment.id).label("total_comments"),
+                func.count(models.Comment.id)
+                .filter(models.Comment.is_blocked == True)
+                .label("blocked_comments"),
+                *by_post,
+            )
+            .filter(
+                models.Comment.date_time_created.between(date_from_dt, date_to_dt),
+                models.Comment.deleted_at.is_(None),
+                *live_post_conditions(),
+            )
+            .group_by(func.date(models.Comment.date_time_created), *by_post)
+            .all()
         )
-        .filter(models.Comment.date_time_created.between(date_from_dt, date_to_dt))
-        .group_by(func.date(models.Comment.date_time_created))
-        .order_by(func.date(models.Comment.date_time_created))
-        .all()
-    )
-
-    analytics = [
-        {
-            "day": result.day,
-            "total_comments": result.total_comments,
-            "blocked_comments": result.blocked_comments,
-        }
-        for result in results
-    ]
 
-    return analytics
+    counts = archive.archive.daily_counts(
+        date_from_dt,
+        date_to_dt,
+        exclude=lambda post_ids: hidden_post_ids_among(db, post_ids),
+    )
+    for results in sharding.fan_out(db, query):
+        if by_post:
+            results = without_hidden_posts(db, results)
+        for result in results:
+            day = counts.setdefault(str(result.day), [0, 0])
+            day[0] += result.total_comments
+            day[1] += result.blocked_comments
+
+    analytics = {
+        day: {"day": day, "total_comments": total, "blocked_comments": blocked}
+        for day, (total, blocked) in counts.items()
+    }
+
+    return [analytics[day] for day in sorted(analytics)]
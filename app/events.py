@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, insert, select
+from sqlalchemy.engine import Engine
+
+from db import models
+from db.engine import engine
+
+load_dotenv()
+
+EVENT_BROKER = os.getenv("EVENT_BROKER", "memory")
+EVENT_HISTORY = int(os.getenv("EVENT_HISTORY", 1000))
+EVENT_POLL_INTERVAL = float(os.getenv("EVENT_POLL_INTERVAL", 0.5))
+EVENT_KEEPALIVE = float(os.getenv("EVENT_KEEPALIVE", 15))
+EVENT_RETENTION = float(os.getenv("EVENT_RETENTION", 3600))
+EVENT_PRUNE_INTERVAL = float(os.getenv("EVENT_PRUNE_INTERVAL", 60))
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    channel: str
+    type: str
+    data: dict
+
+    def encode(self) -> str:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+
+class Subscription:
+    """Queue of events for one client, fed from any thread.
+
+    The queue is bounded; a client that falls behind is cut off (``get``
+    returns ``None``) and is expected to reconnect with its last event id.
+    """
+
+    def __init__(
+        self, broker: "Broker", channel: str, loop: asyncio.AbstractEventLoop
+    ) -> None:
+        self.broker = broker
+        self.channel = channel
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=EVENT_HISTORY)
+
+    def deliver(self, event: Event | None) -> None:
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: Event | None) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.close()
+            self._queue.get_nowait()
+            self._queue.put_nowait(None)
+
+    async def get(self) -> Event | None:
+        return await self._queue.get()
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+class Broker(ABC):
+    """Delivers published events to the subscribers of this worker."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscribers: dict[str, set[Subscription]] = defaultdict(set)
+
+    def _dispatch(self, event: Event) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(event.channel, ()))
+        for subscriber in subscribers:
+            subscriber.deliver(event)
+
+    def _register(self, subscription: Subscription) -> None:
+        self._subscribers[subscription.channel].add(subscription)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers[subscription.channel].discard(subscription)
+            if not self._subscribers[subscription.channel]:
+                del self._subscribers[subscription.channel]
+
+    @abstractmethod
+    def publish(self, channel: str, event_type: str, data: dict) -> Event: ...
+
+    @abstractmethod
+    def subscribe(
+        self,
+        channel: str,
+        loop: asyncio.AbstractEventLoop,
+        last_event_id: int | None = None,
+    ) -> Subscription: ...
+
+    @abstractmethod
+    def prune(self, now: float | None = None) -> None:
+        """Forget events older than ``EVENT_RETENTION`` seconds."""
+
+
+class MemoryBroker(Broker):
+    """In-process pub/sub, enough when the API runs as a single worker.
+
+    The last ``EVENT_HISTORY`` events of every channel are kept so clients can
+    resume from a ``Last-Event-ID``. Ids are derived from the wall clock, so
+    they keep increasing across restarts. Channels without an event for
+    ``EVENT_RETENTION`` seconds are dropped by ``prune``.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._history: dict[str, deque[Event]] = {}
+        self._last_id = 0
+
+    def publish(self, channel: str, event_type: str, data: dict) -> Event:
+        with self._lock:
+            self._last_id = max(self._last_id + 1, time.time_ns() // 1000)
+            event = Event(self._last_id, channel, event_type, data)
+            self._history.setdefault(channel, deque(maxlen=EVENT_HISTORY)).append(event)
+        self._dispatch(event)
+        return event
+
+    def subscribe(
+        self,
+        channel: str,
+        loop: asyncio.AbstractEventLoop,
+        last_event_id: int | None = None,
+    ) -> Subscription:
+        subscription = Subscription(self, channel, loop)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._history.get(channel, ()):
+                    if event.id > last_event_id:
+                        subscription.deliver(event)
+            self._register(subscription)
+        return subscription
+
+    def prune(self, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        # Event ids are microseconds since the epoch.
+        cutoff = (now - EVENT_RETENTION) * 1_000_000
+        with self._lock:
+            for channel, history in list(self._history.items()):
+                if history[-1].id < cutoff:
+                    del self._history[channel]
+
+
+class SQLBroker(Broker):
+    """Pub/sub through the ``events`` table, for fan-out across workers.
+
+    Each worker runs one poller thread that reads new rows with a single
+    indexed range query per interval, however many clients are connected.
+    The table doubles as the history used to resume after a reconnect;
+    ``prune`` deletes rows older than ``EVENT_RETENTION`` seconds.
+    """
+
+    def __init__(self, bind: Engine) -> None:
+        super().__init__()
+        self.bind = bind
+        self._last_id = None
+        self._poller = None
+
+    def publish(self, channel: str, event_type: str, data: dict) -> Event:
+        with self.bind.begin() as connection:
+            event_id = connection.execute(
+                insert(models.Event)
+                .values(
+                    channel=channel,
+                    type=event_type,
+                    data=json.dumps(data),
+                    created_at=time.time(),
+                )
+                .returning(models.Event.id)
+            ).scalar_one()
+        return Event(event_id, channel, event_type, data)
+
+    def subscribe(
+        self,
+        channel: str,
+        loop: asyncio.AbstractEventLoop,
+        last_event_id: int | None = None,
+    ) -> Subscription:
+        self._start_poller()
+        subscription = Subscription(self, channel, loop)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._read(
+                    models.Event.channel == channel,
+                    models.Event.id > last_event_id,
+                    models.Event.id <= self._last_id,
+                ):
+                    subscription.deliver(event)
+            self._register(subscription)
+        return subscription
+
+    def prune(self, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        with self.bind.begin() as connection:
+            connection.execute(
+                delete(models.Event).where(
+                    models.Event.created_at < now - EVENT_RETENTION
+                )
+            )
+
+    def _read(self, *conditions) -> list[Event]:
+        with self.bind.connect() as connection:
+            rows = connection.execute(
+                select(models.Event).where(*conditions).order_by(models.Event.id)
+            ).all()
+        return [
+            Event(row.id, row.channel, row.type, json.loads(row.data)) for row in rows
+        ]
+
+    def _start_poller(self) -> None:
+        with self._lock:
+            if self._poller is not None:
+                return
+            with self.bind.connect() as connection:
+                self._last_id = (
+                    connection.execute(
+                        select(models.Event.id).order_by(models.Event.id.desc())
+                    ).scalar()
+                    or 0
+                )
+            self._poller = threading.Thread(target=self._poll, daemon=True)
+            self._poller.start()
+
+    def _poll(self) -> None:
+        while True:
+            time.sleep(EVENT_POLL_INTERVAL)
+            with self._lock:
+                events = self._read(models.Event.id > self._last_id)
+                if events:
+                    self._last_id = events[-1].id
+            for event in events:
+                self._dispatch(event)
+
+
+broker = SQLBroker(engine) if EVENT_BROKER == "sql" else MemoryBroker()
+
+
+def comment_channel(post_id: int) -> str:
+    return f"post:{post_id}:comments"
@@ -0,0 +1,218 @@
+"""Home feeds built from precomputed per-user timelines.
+
+A new post is written to the timeline of every follower of its author
+(fan-out on write), so reading a feed is one range scan of the reader's
+timeline. Authors with more than ``FEED_FANOUT_LIMIT`` followers are not
+fanned out; their posts are merged into the feed at read time instead, which
+keeps the cost of a single post bounded. Timelines are trimmed to the newest
+``FEED_TIMELINE_LENGTH`` entries in the background.
+"""
+
+import logging
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, literal, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import moderation
+from db import models
+from db.engine import SessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FEED_FANOUT_LIMIT = int(os.getenv("FEED_FANOUT_LIMIT", 10000))
+FEED_TIMELINE_LENGTH = int(os.getenv("FEED_TIMELINE_LENGTH", 800))
+FEED_BACKFILL = int(os.getenv("FEED_BACKFILL", 50))
+FEED_TRIM_INTERVAL = float(os.getenv("FEED_TRIM_INTERVAL", 300))
+
+
+def _insert(db: Session):
+    return postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+
+
+def fan_out_post(db: Session, post: models.Post) -> None:
+    """Add ``post`` to the timelines of its author and their followers."""
+    timeline = models.TimelineEntry
+    db.execute(
+        _insert(db)(timeline)
+        .values(user_id=post.author_id, post_id=post.id, author_id=post.author_id)
+        .on_conflict_do_nothing()
+    )
+    if post.author.follower_count <= FEED_FANOUT_LIMIT:
+        db.execute(
+            _insert(db)(timeline)
+            .from_select(
+                ["user_id", "post_id", "author_id"],
+                select(
+                    models.Follow.follower_id,
+                    literal(post.id),
+                    literal(post.author_id),
+                ).where(models.Follow.followee_id == post.author_id),
+            )
+            .on_conflict_do_nothing()
+        )
+    db.commit()
+
+
+def follow(db: Session, follower_id: int, followee_id: int) -> None:
+    """Follow ``followee_id`` and copy their recent posts into the timeline."""
+    followed = db.execute(
+        _insert(db)(models.Follow)
+        .values(follower_id=follower_id, followee_id=followee_id)
+        .on_conflict_do_nothing()
+    ).rowcount
+    if not followed:
+        return
+
+    follower_count = db.execute(
+        update(models.User)
+        .where(models.User.id == followee_id)
+        .values(follower_count=models.User.follower_count + 1)
+        .returning(models.User.follower_count)
+    ).scalar_one()
+    if follower_count <= FEED_FANOUT_LIMIT:
+        recent_posts = (
+            select(models.Post.id)
+            .where(
+                models.Post.author_id == followee_id,
+                models.Post.deleted_at.is_(None),
+            )
+            .order_by(models.Post.id.desc())
+            .limit(FEED_BACKFILL)
+            .subquery()
+        )
+        db.execute(
+            _insert(db)(models.TimelineEntry)
+            .from_select(
+                ["user_id", "post_id", "author_id"],
+                # SQLite needs a WHERE clause to parse INSERT ... SELECT with
+                # ON CONFLICT.
+                select(
+                    literal(follower_id), recent_posts.c.id, literal(followee_id)
+                ).where(true()),
+            )
+            .on_conflict_do_nothing()
+        )
+    db.commit()
+
+
+def unfollow(db: Session, follower_id: int, followee_id: int) -> None:
+    unfollowed = db.execute(
+        delete(models.Follow).where(
+            models.Follow.follower_id == follower_id,
+            models.Follow.followee_id == followee_id,
+        )
+    ).rowcount
+    if unfollowed:
+        db.execute(
+            update(models.User)
+            .where(models.User.id == followee_id)
+            .values(follower_count=models.User.follower_count - 1)
+        )
+        db.execute(
+            delete(models.TimelineEntry).where(
+                models.TimelineEntry.user_id == follower_id,
+                models.TimelineEntry.author_id == followee_id,
+            )
+        )
+    db.commit()
+
+
+def get_feed(
+    db: Session, user_id: int, cursor: int | None = None, limit: int = 20
+) -> list[models.Post]:
+    """The newest ``limit`` posts of the feed of ``user_id`` below ``cursor``.
+
+    One page reads at most ``limit`` timeline entries plus ``limit`` posts
+    of each followed author that is not fanned out.
+    """
+    timeline = models.TimelineEntry
+    visible = [
+        models.Post.deleted_at.is_(None),
+        moderation.visible_to(models.Post, user_id),
+    ]
+    entries = [timeline.user_id == user_id]
+    if cursor is not None:
+        entries.append(timeline.post_id < cursor)
+
+    posts = (
+        db.execute(
+            select(models.Post)
+            .join(timeline, timeline.post_id == models.Post.id)
+            .where(*entries, *visible)
+            .order_by(timeline.post_id.desc())
+            .limit(limit)
+        )
+        .scalars()
+        .all()
+    )
+
+    popular_authors = (
+        select(models.Follow.followee_id)
+        .join(models.User, models.User.id == models.Follow.followee_id)
+        .where(
+            models.Follow.follower_id == user_id,
+            models.User.follower_count > FEED_FANOUT_LIMIT,
+        )
+    )
+    pulled = (
+        db.execute(
+            select(models.Post)
+            .where(
+                models.Post.author_id.in_(popular_authors),
+                models.Post.id < cursor if cursor is not None else true(),
+                *visible,
+            )
+            .order_by(models.Post.id.desc())
+            .limit(limit)
+        )
+        .scalars()
+        .all()
+    )
+    if not pulled:
+        return posts
+
+    merged = {post.id: post for post in posts + pulled}
+    return sorted(merged.values(), key=lambda post: post.id, reverse=True)[:limit]
+
+
+def trim_timelines(db: Session, length: int = FEED_TIMELINE_LENGTH) -> int:
+    """Drop all but the newest ``length`` entries of every timeline."""
+    timeline = models.TimelineEntry
+    trimmed = 0
+    oversized = db.execute(
+        select(timeline.user_id)
+        .group_by(timeline.user_id)
+        .having(func.count() > length)
+    ).scalars()
+    for user_id in oversized.all():
+        oldest_kept = (
+            select(timeline.post_id)
+            .where(timeline.user_id == user_id)
+            .order_by(timeline.post_id.desc())
+            .offset(length - 1)
+            .limit(1)
+            .scalar_subquery()
+        )
+        trimmed += db.execute(
+            delete(timeline).where(
+                timeline.user_id == user_id, timeline.post_id < oldest_kept
+            )
+        ).rowcount
+        db.commit()
+    return trimmed
+
+
+def run_trimming() -> None:
+    db = SessionLocal()
+    try:
+        trimmed = trim_timelines(db)
+    finally:
+        db.close()
+
+    if trimmed:
+        logger.info("Trimmed %s timeline entries", trimmed)
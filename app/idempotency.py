@@ -0,0 +1,143 @@
+"""``Idempotency-Key`` support for endpoints that create content.
+
+The first request with a key claims it by inserting a row for
+``(user_id, key)``. When it succeeds its response is stored in that row for
+``IDEMPOTENCY_TTL`` seconds and retries with the same key get the stored
+response back without running the endpoint again. A retry that arrives while
+the first request is still running waits up to ``IDEMPOTENCY_WAIT`` seconds
+for its result. A failed request releases its key so it can be retried.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+
+from db import models
+from db.engine import engine
+
+load_dotenv()
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", 10))
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", 60))
+IDEMPOTENCY_CLEANUP_INTERVAL = float(os.getenv("IDEMPOTENCY_CLEANUP_INTERVAL", 300))
+POLL_INTERVAL = 0.05
+
+
+class IdempotencyKeyReused(Exception):
+    pass
+
+
+class IdempotencyKeyInProgress(Exception):
+    pass
+
+
+def fingerprint(method: str, path: str, body: dict) -> str:
+    payload = json.dumps([method, path, body], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, bind: Engine) -> None:
+        self.bind = bind
+        self.insert = (
+            postgresql.insert if bind.dialect.name == "postgresql" else sqlite.insert
+        )
+
+    def begin(
+        self, user_id: int, key: str, request_fingerprint: str
+    ) -> tuple[int, dict] | None:
+        """Claim ``key``, or return the ``(status_code, body)`` stored for it.
+
+        Raises ``IdempotencyKeyReused`` if the key was used for a different
+        request and ``IdempotencyKeyInProgress`` if the request holding it
+        does not finish in time.
+        """
+        table = models.IdempotencyKey
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        while True:
+            now = time.time()
+            with self.bind.begin() as connection:
+                claimed = connection.execute(
+                    self.insert(table)
+                    .values(
+                        user_id=user_id,
+                        key=key,
+                        fingerprint=request_fingerprint,
+                        expires_at=now + IDEMPOTENCY_LOCK_TIMEOUT,
+                    )
+                    .on_conflict_do_nothing()
+                ).rowcount
+                if claimed:
+                    return None
+                # An expired response or the lock of a crashed request is
+                # taken over, atomically in case several retries race for it.
+                claimed = connection.execute(
+                    update(table)
+                    .where(
+                        table.user_id == user_id,
+                        table.key == key,
+                        table.expires_at < now,
+                    )
+                    .values(
+                        fingerprint=request_fingerprint,
+                        status_code=None,
+                        response=None,
+                        expires_at=now + IDEMPOTENCY_LOCK_TIMEOUT,
+                    )
+                ).rowcount
+                if claimed:
+                    return None
+                stored = connection.execute(
+                    select(table.fingerprint, table.status_code, table.response).where(
+                        table.user_id == user_id, table.key == key
+                    )
+                ).first()
+
+            if stored is None:
+                continue
+            if stored.fingerprint != request_fingerprint:
+                raise IdempotencyKeyReused
+            if stored.status_code is not None:
+                return stored.status_code, json.loads(stored.response)
+            if time.monotonic() >= deadline:
+                raise IdempotencyKeyInProgress
+            time.sleep(POLL_INTERVAL)
+
+    def complete(self, user_id: int, key: str, status_code: int, body: dict) -> None:
+        table = models.IdempotencyKey
+        with self.bind.begin() as connection:
+            connection.execute(
+                update(table)
+                .where(table.user_id == user_id, table.key == key)
+                .values(
+                    status_code=status_code,
+                    response=json.dumps(body),
+                    expires_at=time.time() + IDEMPOTENCY_TTL,
+                )
+            )
+
+    def release(self, user_id: int, key: str) -> None:
+        table = models.IdempotencyKey
+        with self.bind.begin() as connection:
+            connection.execute(
+                delete(table).where(
+                    table.user_id == user_id,
+                    table.key == key,
+                    table.status_code.is_(None),
+                )
+            )
+
+    def purge_expired(self) -> None:
+        table = models.IdempotencyKey
+        with self.bind.begin() as connection:
+            connection.execute(delete(table).where(table.expires_at < time.time()))
+
+
+store = IdempotencyStore(engine)
@@ -0,0 +1,60 @@
+import os
+
+import requests
+from dotenv import load_dotenv
+from sqlalchemy import or_, true
+
+load_dotenv()
+
+PROFANITY_FILTER_API = "https://api.api-ninjas.com/v1/profanityfilter?text={}"
+
+MODERATION_MODE = os.getenv("MODERATION_MODE", "sync")
+PENDING_VISIBILITY = os.getenv("PENDING_VISIBILITY", "author")
+
+PENDING = "pending"
+APPROVED = "approved"
+BLOCKED = "blocked"
+
+
+def has_profanity(text: str) -> bool:
+    response = requests.get(
+        PROFANITY_FILTER_API.format(text),
+        headers={"X-Api-Key": os.getenv("API_NINJAS_KEY")},
+    )
+    if response.status_code == 200:
+        return response.json()["has_profanity"]
+    return False
+
+
+def moderate(text: str) -> tuple[bool, str]:
+    """Return ``(is_blocked, moderation_status)`` for newly written content.
+
+    In deferred mode nothing is checked here; the content is stored as
+    pending and moderated later by ``app.moderation_worker``.
+    """
+    if MODERATION_MODE == "deferred":
+        return False, PENDING
+    if has_profanity(text):
+        return True, BLOCKED
+    return False, APPROVED
+
+
+def visible_to(model, viewer_id: int | None):
+    """Filter hiding pending content from everyone but its author.
+
+    With ``PENDING_VISIBILITY=all`` pending content is shown to everyone.
+    """
+    if viewer_id is None or PENDING_VISIBILITY == "all":
+        return true()
+    return or_(model.moderation_status != PENDING, model.author_id == viewer_id)
+
+
+def is_public(row) -> bool:
+    """Whether anyone may see ``row``, e.g. in a broadcast event.
+
+    Blocked content is never broadcast, and pending content only with
+    ``PENDING_VISIBILITY=all``.
+    """
+    if row.is_blocked:
+        return False
+    return row.moderation_status != PENDING or PENDING_VISIBILITY == "all"
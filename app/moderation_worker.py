@@ -0,0 +1,195 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, case, literal_column, select, true, tuple_, update
+from sqlalchemy.orm import Session
+
+from app import counters, crud, moderation
+from db import models, sharding
+from db.engine import SessionLocal
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MODERATION_INTERVAL = float(os.getenv("MODERATION_INTERVAL", 2))
+MODERATION_BATCH_SIZE = int(os.getenv("MODERATION_BATCH_SIZE", 100))
+MODERATION_CONCURRENCY = int(os.getenv("MODERATION_CONCURRENCY", 8))
+RUN_MODERATION_WORKER = os.getenv("RUN_MODERATION_WORKER", "1") == "1"
+
+_executor = ThreadPoolExecutor(max_workers=MODERATION_CONCURRENCY)
+
+
+def content(row) -> str:
+    if hasattr(row, "title"):
+        return f"{row.title} {row.text}"
+    return row.text
+
+
+def store_verdicts(
+    session: Session,
+    model,
+    verdicts: list[tuple[int, int, bool]],
+    db: Session | None = None,
+) -> None:
+    """Store ``(id, version, is_blocked)`` verdicts with one ``UPDATE``.
+
+    A row only takes its verdict if its version did not change while it was
+    being checked; an edited row keeps whatever its edit wrote. The update
+    also returns each row's previous state, read by a materialized CTE that
+    is evaluated before any row changes, so only rows it actually changed
+    are counted when their blocked state flips. Comments of deleted posts
+    take their verdict but are not counted; ``db`` holds the posts when it
+    is not ``session``, i.e. when comments are sharded. Comments enter the
+    trending ranking once approved and leave it once blocked.
+    """
+    if not verdicts:
+        return
+    db = session if db is None else db
+    blocked_ids = [row_id for row_id, _, blocked in verdicts if blocked]
+    versions = [(row_id, version) for row_id, version, _ in verdicts]
+
+    def guard() -> list:
+        # Each use needs its own expanding parameter.
+        return [
+            tuple_(model.id, model.version).in_(versions),
+            model.deleted_at.is_(None),
+        ]
+
+    columns = [model.id, model.is_blocked, model.moderation_status]
+    if model is models.Comment:
+        columns.append(and_(true(), *crud.live_post_conditions()).label("live"))
+    old = (
+        select(*columns)
+        .where(*guard())
+        .with_for_update()
+        .cte("old")
+        .prefix_with("MATERIALIZED")
+    )
+    # SQLite only accepts the updated table in RETURNING by its plain name.
+    row_id = literal_column(f"{model.__tablename__}.id")
+    rows = session.execute(
+        update(model)
+        .where(*guard(), model.id.in_(select(old.c.id)))
+        .values(
+            is_blocked=model.id.in_(blocked_ids),
+            moderation_status=case(
+                (model.id.in_(blocked_ids), moderation.BLOCKED),
+                else_=moderation.APPROVED,
+            ),
+        )
+        .returning(
+            *model.__table__.columns,
+            *(
+                select(column)
+                .where(old.c.id == row_id)
+                .scalar_subquery()
+                .label(f"was_{column.name}")
+                for column in old.c
+                if column.name != "id"
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    hidden = set()
+    if model is models.Comment and db is not session:
+        hidden = crud.hidden_post_ids_among(db, {row.post_id for row in rows})
+    ranked = []
+    for row in rows:
+        if model is models.Comment and (not row.was_live or row.post_id in hidden):
+            continue
+        if row.is_blocked != bool(row.was_is_blocked):
+            counters.count(
+                session,
+                model,
+                getattr(row, "post_id", None),
+                row.author_id,
+                blocked=1 if row.is_blocked else -1,
+            )
+        if model is models.Comment:
+            delta = (row.moderation_status == moderation.APPROVED) - (
+                row.was_moderation_status == moderation.APPROVED
+            )
+            if delta:
+                ranked.append((row, delta))
+    session.commit()
+    for row, delta in ranked:
+        crud.record_trending(row, delta)
+
+
+def moderate_pending(db: Session, batch_size: int = MODERATION_BATCH_SIZE) -> int:
+    """Moderate up to ``batch_size`` pending posts, and as many comments per shard.
+
+    Texts are checked concurrently, so a batch takes roughly
+    ``batch_size / MODERATION_CONCURRENCY`` profanity API round trips.
+    Approved comments are published as ``comment.created`` events, or
+    ``comment.updated`` once edited, and get their auto reply.
+    """
+    moderated = _moderate_batch(db, db, models.Post, batch_size)
+    with sharding.comment_sessions(db) as sessions:
+        for session in sessions:
+            moderated += _moderate_batch(db, session, models.Comment, batch_size)
+    return moderated
+
+
+def _moderate_batch(db: Session, session: Session, model, batch_size: int) -> int:
+    rows = (
+        session.execute(
+            select(model)
+            .where(
+                model.moderation_status == moderation.PENDING,
+                model.deleted_at.is_(None),
+            )
+            .order_by(model.id)
+            .limit(batch_size)
+        )
+        .scalars()
+        .all()
+    )
+    if not rows:
+        return 0
+
+    ids = [row.id for row in rows]
+    verdicts = _executor.map(lambda row: moderation.has_profanity(content(row)), rows)
+    store_verdicts(
+        session,
+        model,
+        [(row.id, row.version, blocked) for row, blocked in zip(rows, verdicts)],
+        db,
+    )
+    rows = (
+        session.execute(
+            select(model).where(
+                model.id.in_(ids), model.moderation_status != moderation.PENDING
+            )
+        )
+        .scalars()
+        .all()
+    )
+
+    if model is models.Comment:
+        for db_comment in rows:
+            if db_comment.moderation_status != moderation.APPROVED:
+                continue
+            # Comments hidden while pending are published once approved.
+            if moderation.PENDING_VISIBILITY != "all":
+                edited = db_comment.version > 1
+                event_type = "comment.updated" if edited else "comment.created"
+                crud.publish_comment_event(event_type, db_comment)
+            post = crud.get_post_by_id(db, db_comment.post_id)
+            if post is not None:
+                crud.create_auto_reply(db, post=post, db_comment=db_comment)
+
+    return len(rows)
+
+
+def run_moderation() -> None:
+    db = SessionLocal()
+    try:
+        while moderated := moderate_pending(db):
+            logger.info("Moderated %s pending posts and comments", moderated)
+    finally:
+        db.close()
@@ -0,0 +1,119 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_PROFILE_SECONDS = float(os.getenv("MAX_PROFILE_SECONDS", 60))
+
+_profiler_lock = threading.Lock()
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+def _is_project_file(filename: str) -> bool:
+    return (
+        filename.startswith(PROJECT_ROOT)
+        and "site-packages" not in filename
+        and filename != __file__
+    )
+
+
+def _frame_key(frame) -> tuple[str, str, str]:
+    code = frame.f_code
+    return (
+        frame.f_globals.get("__name__", "?"),
+        code.co_name,
+        (
+            os.path.relpath(code.co_filename, PROJECT_ROOT)
+            if _is_project_file(code.co_filename)
+            else code.co_filename
+        ),
+    )
+
+
+def _collect_stacks(seconds: float, interval: float) -> tuple[Counter, int, float]:
+    """Sample the stacks of every other thread until ``seconds`` have elapsed.
+
+    Only stacks passing through project code (route handlers, crud functions)
+    are kept, so idle threadpool and event loop threads do not drown them out.
+    """
+    own_thread = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    started = time.monotonic()
+    deadline = started + seconds
+
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            stack = []
+            in_project = False
+            while frame is not None:
+                stack.append(_frame_key(frame))
+                in_project = in_project or _is_project_file(frame.f_code.co_filename)
+                frame = frame.f_back
+            if in_project:
+                stacks[tuple(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+
+    return stacks, samples, time.monotonic() - started
+
+
+def _collapse(stacks: Counter) -> str:
+    lines = [
+        ";".join(f"{module}:{function}" for module, function, _ in stack) + f" {count}"
+        for stack, count in stacks.most_common()
+    ]
+    return "\n".join(lines)
+
+
+def _function_stats(stacks: Counter) -> list[dict]:
+    self_samples = Counter()
+    total_samples = Counter()
+    for stack, count in stacks.items():
+        for key in set(stack):
+            total_samples[key] += count
+        self_samples[stack[-1]] += count
+
+    total = sum(stacks.values()) or 1
+    return [
+        {
+            "function": f"{module}:{function}",
+            "file": filename,
+            "self_samples": self_samples[(module, function, filename)],
+            "total_samples": count,
+            "total_percent": round(100 * count / total, 2),
+        }
+        for (module, function, filename), count in total_samples.most_common()
+        if _is_project_file(os.path.join(PROJECT_ROOT, filename))
+    ]
+
+
+def profile(seconds: float, interval: float = 0.005) -> dict:
+    """Run the sampling profiler on this worker for ``seconds`` seconds.
+
+    Nothing is installed while the profiler is idle, so it costs nothing
+    unless a profile is being taken. Only one profile may run at a time.
+    """
+    if not _profiler_lock.acquire(blocking=False):
+        raise ProfilerBusyError("A profile is already running on this worker")
+
+    try:
+        stacks, samples, duration = _collect_stacks(
+            min(seconds, MAX_PROFILE_SECONDS), interval
+        )
+    finally:
+        _profiler_lock.release()
+
+    return {
+        "duration": round(duration, 3),
+        "samples": samples,
+        "collapsed": _collapse(stacks),
+        "functions": _function_stats(stacks),
+    }
@@ -0,0 +1,145 @@
+import heapq
+import os
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import case
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+
+from db import models
+from db.engine import engine
+
+load_dotenv()
+
+
+def parse_limit(value: str) -> tuple[float, float]:
+    """Parse ``"<requests>/<seconds>"`` into ``(capacity, refill per second)``."""
+    requests, seconds = value.split("/")
+    return float(requests), float(requests) / float(seconds)
+
+
+LIMITS = {
+    "user": parse_limit(os.getenv("USER_RATE_LIMIT", "120/60")),
+    "posts": parse_limit(os.getenv("POSTS_RATE_LIMIT", "30/60")),
+    "comments": parse_limit(os.getenv("COMMENTS_RATE_LIMIT", "60/60")),
+    "ai": parse_limit(os.getenv("AI_RATE_LIMIT", "10/60")),
+}
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+MAX_MEMORY_BUCKETS = 100_000
+# A full memory backend is swept down to this share of its size, so the
+# sweep runs once per many new buckets instead of on every take.
+MEMORY_BUCKETS_LOW_WATER = 0.9
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Rate limit exceeded, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class MemoryBackend:
+    """Token buckets kept in this worker's memory.
+
+    Every bucket is an immutable ``(tokens, updated_at, capacity, rate)``
+    tuple swapped in with a single dict assignment, so no lock is taken. Two
+    racing requests may both read the same bucket and be admitted, which
+    over-admits by at most one token per racing thread.
+    """
+
+    def __init__(self) -> None:
+        self._buckets: dict[str, tuple[float, float, float, float]] = {}
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> float:
+        tokens, updated_at, _, _ = self._buckets.get(key, (capacity, now, 0, 0))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+
+        if len(self._buckets) >= MAX_MEMORY_BUCKETS:
+            self._evict_full(now)
+
+        if tokens < 1:
+            self._buckets[key] = (tokens, now, capacity, rate)
+            return (1 - tokens) / rate
+        self._buckets[key] = (tokens - 1, now, capacity, rate)
+        return 0
+
+    def _evict_full(self, now: float) -> None:
+        # A bucket that has refilled completely is indistinguishable from a
+        # missing one, so it can be dropped without changing any decision.
+        # Buckets of every scope are swept, each judged by its own limit.
+        def refilled_in(bucket: tuple[float, float, float, float]) -> float:
+            tokens, updated_at, capacity, rate = bucket
+            return (capacity - tokens - (now - updated_at) * rate) / rate
+
+        buckets = list(self._buckets.items())
+        for key, bucket in buckets:
+            if refilled_in(bucket) <= 0:
+                self._buckets.pop(key, None)
+        # Under key churn the rest goes down to the low-water mark, dropping
+        # the buckets closest to full, which forgets the least.
+        excess = len(self._buckets) - int(MAX_MEMORY_BUCKETS * MEMORY_BUCKETS_LOW_WATER)
+        if excess > 0:
+            for key, _ in heapq.nsmallest(
+                excess,
+                ((key, bucket) for key, bucket in buckets if key in self._buckets),
+                key=lambda item: refilled_in(item[1]),
+            ):
+                self._buckets.pop(key, None)
+
+    def reset(self) -> None:
+        self._buckets.clear()
+
+
+class SQLBackend:
+    """Token buckets shared by every worker through the database.
+
+    A take is one ``INSERT ... ON CONFLICT DO UPDATE ... WHERE`` statement, so
+    the refill, the check and the decrement are atomic without extra locks.
+    Any store with compare-and-set semantics (e.g. Redis with a Lua script)
+    can implement the same ``take`` contract.
+    """
+
+    def __init__(self, bind: Engine) -> None:
+        self.bind = bind
+        self.insert = (
+            postgresql.insert if bind.dialect.name == "postgresql" else sqlite.insert
+        )
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> float:
+        bucket = models.RateLimitBucket
+        refilled = bucket.tokens + (now - bucket.updated_at) * rate
+        refilled = case((refilled > capacity, capacity), else_=refilled)
+
+        statement = self.insert(bucket).values(
+            key=key, tokens=capacity - 1, updated_at=now
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[bucket.key],
+            set_={"tokens": refilled - 1, "updated_at": now},
+            where=refilled >= 1,
+        )
+
+        with self.bind.begin() as connection:
+            if connection.execute(statement).rowcount:
+                return 0
+            tokens, updated_at = connection.execute(
+                bucket.__table__.select()
+                .with_only_columns(bucket.tokens, bucket.updated_at)
+                .where(bucket.key == key)
+            ).one()
+
+        return (1 - min(capacity, tokens + (now - updated_at) * rate)) / rate
+
+    def reset(self) -> None:
+        with self.bind.begin() as connection:
+            connection.execute(models.RateLimitBucket.__table__.delete())
+
+
+backend = SQLBackend(engine) if RATE_LIMIT_BACKEND == "sql" else MemoryBackend()
+
+
+def hit(scope: str, user_id: int) -> None:
+    capacity, rate = LIMITS[scope]
+    retry_after = backend.take(f"{scope}:{user_id}", capacity, rate, time.time())
+    if retry_after:
+        raise RateLimitExceeded(retry_after)
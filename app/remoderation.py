@@ -0,0 +1,175 @@
+"""Re-check every post and comment after the moderation rules changed.
+
+Usage::
+
+    python -m app.remoderation [--tables posts comments] [--chunk-size 500]
+        [--concurrency 8] [--pause 0] [--checkpoint remoderation.json] [--restart]
+
+Rows are scanned in primary key order, one chunk per short transaction, and
+the last finished id of each table is written to the checkpoint file, so an
+interrupted run continues where it stopped.
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app import moderation
+from app.moderation_worker import content, store_verdicts
+from db import models, sharding
+from db.engine import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+TABLES = {"posts": models.Post, "comments": models.Comment}
+
+
+def load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as checkpoint:
+        return json.load(checkpoint)
+
+
+def save_checkpoint(path: str, progress: dict) -> None:
+    with open(f"{path}.tmp", "w") as checkpoint:
+        json.dump(progress, checkpoint)
+    os.replace(f"{path}.tmp", path)
+
+
+def _columns(model) -> list:
+    columns = [model.id, model.version, model.is_blocked, model.text]
+    if model is models.Post:
+        columns.append(model.title)
+    return columns
+
+
+def remoderate_table(
+    db: Session,
+    name: str,
+    executor: ThreadPoolExecutor,
+    progress: dict,
+    checkpoint_path: str,
+    chunk_size: int,
+    pause: float = 0,
+    key: str | None = None,
+    posts_db: Session | None = None,
+) -> dict:
+    """Re-check one table chunk by chunk, starting after ``progress[key]``.
+
+    ``key`` defaults to the table name; each comment shard has its own.
+    ``posts_db`` holds the posts when ``db`` is a comment shard.
+
+    Only rows whose verdict changed are written, guarded by their version so
+    a concurrent edit is never overwritten. Pending rows are left to the
+    moderation worker.
+    """
+    model = TABLES[name]
+    key = key or name
+    stats = {"checked": 0, "changed": 0, "seconds": 0.0}
+    started = time.monotonic()
+
+    while True:
+        rows = db.execute(
+            select(*_columns(model))
+            .where(
+                model.id > progress.get(key, 0),
+                model.deleted_at.is_(None),
+                model.moderation_status != moderation.PENDING,
+            )
+            .order_by(model.id)
+            .limit(chunk_size)
+        ).all()
+        db.rollback()
+        if not rows:
+            break
+
+        verdicts = executor.map(
+            lambda row: moderation.has_profanity(content(row)), rows
+        )
+        changed = [
+            (row.id, row.version, blocked)
+            for row, blocked in zip(rows, verdicts)
+            if blocked != row.is_blocked
+        ]
+        if changed:
+            store_verdicts(db, model, changed, posts_db)
+
+        progress[key] = rows[-1].id
+        save_checkpoint(checkpoint_path, progress)
+
+        stats["checked"] += len(rows)
+        stats["changed"] += len(changed)
+        stats["seconds"] = time.monotonic() - started
+        logger.info(
+            "%s: checked %s rows up to id %s, %s changed, %.1f rows/s",
+            key,
+            stats["checked"],
+            rows[-1].id,
+            stats["changed"],
+            stats["checked"] / stats["seconds"],
+        )
+        if pause:
+            time.sleep(pause)
+
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", nargs="+", choices=TABLES, default=list(TABLES))
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--pause", type=float, default=0, help="Seconds to sleep between chunks"
+    )
+    parser.add_argument("--checkpoint", default="remoderation.json")
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore the checkpoint file"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    progress = {} if args.restart else load_checkpoint(args.checkpoint)
+
+    db = SessionLocal()
+    try:
+        with ThreadPoolExecutor(
+            max_workers=args.concurrency
+        ) as executor, sharding.comment_sessions(db) as comment_sessions:
+            targets = {
+                "posts": [(db, "posts")],
+                "comments": [
+                    (
+                        session,
+                        f"comments:{index}" if sharding.shard_sessions else "comments",
+                    )
+                    for index, session in enumerate(comment_sessions)
+                ],
+            }
+            for name in args.tables:
+                for session, key in targets[name]:
+                    stats = remoderate_table(
+                        session,
+                        name,
+                        executor,
+                        progress,
+                        args.checkpoint,
+                        args.chunk_size,
+                        args.pause,
+                        key,
+                        db,
+                    )
+                    logger.info("%s done: %s", key, stats)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -19,11 +19,18 @@ class Post(PostBase):
     author_id: int
     date_time_created: datetime
     is_blocked: bool
+    moderation_status: str
+    version: int
 
     class Config:
         orm_mode = True
 
 
+class TrendingPost(BaseModel):
+    post: Post
+    score: float
+
+
 class CommentBase(BaseModel):
     text: str
     post_id: int
@@ -38,6 +45,18 @@ class Comment(CommentBase):
     author_id: int
     date_time_created: datetime
     is_blocked: bool
+    moderation_status: str
+    version: int
 
     class Config:
         orm_mode = True
+
+
+class AuthorStats(BaseModel):
+    author_id: int
+    posts: int
+    blocked_posts: int
+    comments: int
+    blocked_comments: int
+    blocked_ratio: float
+    last_active_at: datetime | None
@@ -0,0 +1,179 @@
+"""Near-duplicate detection for comment floods.
+
+Every comment is summarized by a MinHash signature of its character
+shingles, and the signatures of the last ``SPAM_WINDOW_SECONDS`` are kept in
+an in-memory LSH index: the signature is split into bands and two comments
+are compared only when one of their bands is identical, so a lookup touches
+a handful of candidates instead of the whole window. Candidates whose
+estimated Jaccard similarity is at least ``SPAM_SIMILARITY`` count as copies.
+
+A comment is a flood once its author already posted ``SPAM_AUTHOR_LIMIT``
+copies, or anyone posted ``SPAM_GLOBAL_LIMIT`` copies, within the window.
+Floods are not added to the index, so a cluster of copies never grows past
+the global limit. Comments shorter than ``SPAM_MIN_WORDS`` words ("thanks!")
+are legitimately repeated and are not checked.
+
+The index lives in each worker's memory and holds at most
+``SPAM_MAX_ENTRIES`` comments.
+"""
+
+import hashlib
+import heapq
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SPAM_WINDOW_SECONDS = float(os.getenv("SPAM_WINDOW_SECONDS", 3600))
+SPAM_SIMILARITY = float(os.getenv("SPAM_SIMILARITY", 0.6))
+SPAM_AUTHOR_LIMIT = int(os.getenv("SPAM_AUTHOR_LIMIT", 3))
+SPAM_GLOBAL_LIMIT = int(os.getenv("SPAM_GLOBAL_LIMIT", 20))
+SPAM_MIN_WORDS = int(os.getenv("SPAM_MIN_WORDS", 5))
+SPAM_MAX_ENTRIES = int(os.getenv("SPAM_MAX_ENTRIES", 100_000))
+# "reject" refuses flood comments, "block" stores them as blocked.
+SPAM_ACTION = os.getenv("SPAM_ACTION", "reject")
+
+SHINGLE_SIZE = 5
+# Signatures run on the request path, so their cost is bounded: only the
+# first ``SIGNATURE_CHARS`` characters of a comment are shingled, and only
+# the ``MAX_SHINGLES`` shingles with the smallest hashes go through the hash
+# functions. The sample is picked by hash, so copies of a text keep the same
+# sample.
+SIGNATURE_CHARS = 2000
+MAX_SHINGLES = 128
+# 128 hash functions estimate a similarity of 0.75, typical of a one-word
+# edit, with a standard deviation of about 0.04, so copies stay clear of the
+# default threshold. Bands of 4 rows make nearly every pair above 0.5 a
+# candidate.
+BANDS = 32
+ROWS = 4
+_PRIME = (1 << 61) - 1
+# Each hash function of the MinHash is ``(a * x + b) mod p`` over the
+# shingle hash, with fixed random coefficients.
+_random = random.Random(0)
+_PERMUTATIONS = [
+    (_random.randrange(1, _PRIME), _random.randrange(_PRIME))
+    for _ in range(BANDS * ROWS)
+]
+
+
+class SpamDetected(Exception):
+    pass
+
+
+def normalize(text: str) -> list[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def shingles(words: list[str]) -> set[str]:
+    text = " ".join(words)
+    return {
+        text[start : start + SHINGLE_SIZE]
+        for start in range(max(1, len(text) - SHINGLE_SIZE + 1))
+    }
+
+
+def signature(words: list[str]) -> tuple[int, ...]:
+    hashes = heapq.nsmallest(
+        MAX_SHINGLES,
+        {
+            int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest())
+            for shingle in shingles(words)
+        },
+    )
+    return tuple(
+        min((a * value + b) % _PRIME for value in hashes) for a, b in _PERMUTATIONS
+    )
+
+
+def similarity(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class DuplicateIndex:
+    def __init__(
+        self,
+        window: float = SPAM_WINDOW_SECONDS,
+        threshold: float = SPAM_SIMILARITY,
+        author_limit: int = SPAM_AUTHOR_LIMIT,
+        global_limit: int = SPAM_GLOBAL_LIMIT,
+        min_words: int = SPAM_MIN_WORDS,
+        max_entries: int = SPAM_MAX_ENTRIES,
+    ) -> None:
+        self.window = window
+        self.threshold = threshold
+        self.author_limit = author_limit
+        self.global_limit = global_limit
+        self.min_words = min_words
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._next_id = 0
+        # Entry id -> ``(created_at, author_id, signature)``, oldest first.
+        self._entries: OrderedDict[int, tuple[float, int, tuple[int, ...]]] = (
+            OrderedDict()
+        )
+        self._buckets: dict[tuple[int, tuple[int, ...]], set[int]] = defaultdict(set)
+
+    def _band_keys(self, sig: tuple[int, ...]) -> list[tuple[int, tuple[int, ...]]]:
+        return [(band, sig[band * ROWS : (band + 1) * ROWS]) for band in range(BANDS)]
+
+    def is_flood(self, author_id: int, text: str, now: float | None = None) -> bool:
+        """Whether ``text`` floods; if not it is added to the index."""
+        words = normalize(text[:SIGNATURE_CHARS])
+        if len(words) < self.min_words:
+            return False
+        sig = signature(words)
+        keys = self._band_keys(sig)
+        now = time.time() if now is None else now
+
+        with self._lock:
+            self._evict(now)
+            candidates = set()
+            for key in keys:
+                candidates.update(self._buckets.get(key, ()))
+            copies = [
+                self._entries[entry_id][1]
+                for entry_id in candidates
+                if similarity(self._entries[entry_id][2], sig) >= self.threshold
+            ]
+            if (
+                copies.count(author_id) >= self.author_limit
+                or len(copies) >= self.global_limit
+            ):
+                return True
+
+            entry_id, self._next_id = self._next_id, self._next_id + 1
+            self._entries[entry_id] = (now, author_id, sig)
+            for key in keys:
+                self._buckets[key].add(entry_id)
+            return False
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            entry_id, (created_at, _, sig) = next(iter(self._entries.items()))
+            if created_at > now - self.window and len(self._entries) < self.max_entries:
+                return
+            del self._entries[entry_id]
+            for key in self._band_keys(sig):
+                bucket = self._buckets[key]
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+
+index = DuplicateIndex()
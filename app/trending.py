@@ -0,0 +1,238 @@
+"""Trending posts ranked by exponentially decayed comment activity.
+
+Every comment adds ``2 ** ((t - EPOCH) / half_life)`` to the score of its
+post. Since all scores decay at the same rate, the order of two posts only
+changes when one of them gets activity, so the top ``TRENDING_TOP_K`` list is
+maintained incrementally and never has to be recomputed as time passes.
+Scores are kept as base-2 logarithms to stay finite.
+
+Activity is also counted per post and ``TRENDING_BUCKET_SECONDS`` bucket in
+the ``post_activity`` table. Each worker periodically adds its own counts
+there and reloads the posts other workers touched, so all workers converge
+on the same ranking, and a restarted worker rebuilds it from the table.
+"""
+
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+
+from db import models
+from db.engine import engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", 6))
+TRENDING_TOP_K = int(os.getenv("TRENDING_TOP_K", 100))
+TRENDING_BUCKET_SECONDS = int(os.getenv("TRENDING_BUCKET_SECONDS", 300))
+TRENDING_SYNC_INTERVAL = float(os.getenv("TRENDING_SYNC_INTERVAL", 10))
+
+EPOCH = 1704067200
+# Activity older than this many half-lives weighs less than 0.1% of new
+# activity and is forgotten.
+HORIZON_HALF_LIVES = 10
+
+
+def _log_add(a: float, b: float) -> float:
+    high, low = max(a, b), min(a, b)
+    if low == -math.inf:
+        return high
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def _log_sub(a: float, b: float) -> float:
+    if b >= a - 1e-9:
+        return -math.inf
+    return a + math.log2(1 - 2 ** (b - a))
+
+
+class Ranking:
+    def __init__(
+        self,
+        bind: Engine,
+        half_life: float = TRENDING_HALF_LIFE_HOURS * 3600,
+        top_k: int = TRENDING_TOP_K,
+        bucket_seconds: int = TRENDING_BUCKET_SECONDS,
+    ) -> None:
+        self.bind = bind
+        self.half_life = half_life
+        self.top_k = top_k
+        self.bucket_seconds = bucket_seconds
+        self._lock = threading.Lock()
+        self._scores: dict[int, float] = {}
+        # Ascending ``(score, post_id)`` pairs of the best ``top_k`` posts.
+        self._top: list[tuple[float, int]] = []
+        self._pending: dict[tuple[int, int], int] = defaultdict(int)
+        self._synced_at = 0.0
+
+    def _weight(self, timestamp: float) -> float:
+        return (timestamp - EPOCH) / self.half_life
+
+    def _bucket(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds * self.bucket_seconds)
+
+    def _horizon(self, now: float) -> int:
+        return self._bucket(now - HORIZON_HALF_LIVES * self.half_life)
+
+    def _set_score(self, post_id: int, score: float) -> None:
+        old = self._scores.pop(post_id, None)
+        was_top = old is not None and self._remove_top((old, post_id))
+        if score > -math.inf:
+            self._scores[post_id] = score
+
+        if was_top and score < old:
+            # A post outside the list may now rank higher than this one.
+            ranked = {entry[1] for entry in self._top}
+            best = max(
+                (
+                    (other_score, other_id)
+                    for other_id, other_score in self._scores.items()
+                    if other_id not in ranked
+                ),
+                default=None,
+            )
+            if best is not None:
+                bisect.insort(self._top, best)
+        elif score > -math.inf:
+            self._offer((score, post_id))
+
+    def _remove_top(self, entry: tuple[float, int]) -> bool:
+        index = bisect.bisect_left(self._top, entry)
+        if index < len(self._top) and self._top[index] == entry:
+            del self._top[index]
+            return True
+        return False
+
+    def _offer(self, entry: tuple[float, int]) -> None:
+        if len(self._top) < self.top_k:
+            bisect.insort(self._top, entry)
+        elif entry > self._top[0]:
+            bisect.insort(self._top, entry)
+            del self._top[0]
+
+    def record(self, post_id: int, timestamp: float, delta: int = 1) -> None:
+        """Count a comment added (``delta=1``) or removed (``delta=-1``)."""
+        bucket = self._bucket(timestamp)
+        if bucket < self._horizon(time.time()):
+            return
+        weight = self._weight(bucket)
+        with self._lock:
+            score = self._scores.get(post_id, -math.inf)
+            if delta > 0:
+                score = _log_add(score, weight)
+            else:
+                score = _log_sub(score, weight)
+            self._set_score(post_id, score)
+            self._pending[post_id, bucket] += delta
+
+    def top(self, limit: int) -> list[tuple[int, float]]:
+        """The ``limit`` best ``(post_id, score)`` pairs, scored as of now."""
+        now_weight = self._weight(time.time())
+        with self._lock:
+            best = self._top[::-1][:limit]
+        return [(post_id, 2 ** (score - now_weight)) for score, post_id in best]
+
+    def sync(self) -> None:
+        """Store this worker's counts and load the posts others changed."""
+        now = time.time()
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+        synced_at, self._synced_at = self._synced_at, now
+
+        try:
+            rows = self._store_and_load(pending, synced_at, now)
+        except Exception:
+            with self._lock:
+                for key, delta in pending.items():
+                    self._pending[key] += delta
+            self._synced_at = synced_at
+            raise
+
+        scores = {}
+        for post_id, bucket, count in rows:
+            scores.setdefault(post_id, -math.inf)
+            if count > 0:
+                scores[post_id] = _log_add(
+                    scores[post_id], math.log2(count) + self._weight(bucket)
+                )
+        with self._lock:
+            # Activity recorded while the table was being read is not in it.
+            for (post_id, bucket), delta in self._pending.items():
+                if post_id in scores and delta:
+                    combine = _log_add if delta > 0 else _log_sub
+                    scores[post_id] = combine(
+                        scores[post_id], math.log2(abs(delta)) + self._weight(bucket)
+                    )
+            for post_id, score in scores.items():
+                self._set_score(post_id, score)
+            self._forget(now)
+
+    def _store_and_load(
+        self, pending: dict[tuple[int, int], int], synced_at: float, now: float
+    ) -> list:
+        activity = models.PostActivity
+        insert = (
+            postgresql.insert
+            if self.bind.dialect.name == "postgresql"
+            else sqlite.insert
+        )
+        with self.bind.begin() as connection:
+            if pending:
+                statement = insert(activity).values(
+                    [
+                        {
+                            "post_id": post_id,
+                            "bucket": bucket,
+                            "count": delta,
+                            "updated_at": now,
+                        }
+                        for (post_id, bucket), delta in pending.items()
+                    ]
+                )
+                connection.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=[activity.post_id, activity.bucket],
+                        set_={
+                            "count": activity.count + statement.excluded.count,
+                            "updated_at": now,
+                        },
+                    )
+                )
+            connection.execute(
+                delete(activity).where(activity.bucket < self._horizon(now))
+            )
+            # Workers' clocks and commits are not perfectly aligned, so a
+            # little activity is re-read rather than missed.
+            changed = select(activity.post_id).where(
+                activity.updated_at > synced_at - 2 * TRENDING_SYNC_INTERVAL
+            )
+            return connection.execute(
+                select(activity.post_id, activity.bucket, activity.count).where(
+                    activity.post_id.in_(changed)
+                )
+            ).all()
+
+    def _forget(self, now: float) -> None:
+        horizon = self._weight(self._horizon(now))
+        for post_id, score in list(self._scores.items()):
+            if score < horizon:
+                self._set_score(post_id, -math.inf)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._scores.clear()
+            self._top.clear()
+            self._pending.clear()
+
+
+ranking = Ranking(engine)
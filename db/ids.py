@@ -0,0 +1,156 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+
+from db.engine import engine
+
+load_dotenv()
+
+SNOWFLAKE_IDS = os.getenv("SNOWFLAKE_IDS") == "1"
+# Without a fixed worker id every process leases one from the database.
+SNOWFLAKE_WORKER_ID = (
+    int(os.environ["SNOWFLAKE_WORKER_ID"]) if os.getenv("SNOWFLAKE_WORKER_ID") else None
+)
+SNOWFLAKE_LEASE_SECONDS = float(os.getenv("SNOWFLAKE_LEASE_SECONDS", 300))
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_ID_BITS = 10
+SEQUENCE_BITS = 12
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+class WorkerLease:
+    """A worker id leased from the ``snowflake_workers`` table.
+
+    The lease is taken at startup and renewed by a background task every
+    third of it (see ``renew_lease``), never while ids are generated: on
+    SQLite a second connection would wait for the write lock held by the
+    session flushing the row that needs the id. A lapsed lease is renewed if
+    nobody claimed the id in the meantime and otherwise replaced by a free id.
+    """
+
+    def __init__(self, bind: Engine, seconds: float = SNOWFLAKE_LEASE_SECONDS) -> None:
+        self.bind = bind
+        self.seconds = seconds
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.worker_id: int | None = None
+        self._lock = threading.Lock()
+
+    def current(self) -> int:
+        if self.worker_id is None:
+            raise RuntimeError("No Snowflake worker id is leased yet")
+        return self.worker_id
+
+    def renew(self) -> None:
+        with self._lock:
+            self._renew()
+
+    def _renew(self) -> None:
+        from db.models import SnowflakeWorker
+
+        now = time.time()
+        insert = (
+            postgresql.insert
+            if self.bind.dialect.name == "postgresql"
+            else sqlite.insert
+        )
+        with self.bind.begin() as connection:
+            if (
+                self.worker_id is not None
+                and connection.execute(
+                    update(SnowflakeWorker)
+                    .where(
+                        SnowflakeWorker.worker_id == self.worker_id,
+                        SnowflakeWorker.holder == self.holder,
+                    )
+                    .values(expires_at=now + self.seconds)
+                ).rowcount
+            ):
+                return
+
+            leased = set(
+                connection.execute(
+                    select(SnowflakeWorker.worker_id).where(
+                        SnowflakeWorker.expires_at > now
+                    )
+                ).scalars()
+            )
+            for worker_id in range(1 << WORKER_ID_BITS):
+                if worker_id in leased:
+                    continue
+                statement = insert(SnowflakeWorker).values(
+                    worker_id=worker_id,
+                    holder=self.holder,
+                    expires_at=now + self.seconds,
+                )
+                statement = statement.on_conflict_do_update(
+                    index_elements=[SnowflakeWorker.worker_id],
+                    set_={"holder": self.holder, "expires_at": now + self.seconds},
+                    where=SnowflakeWorker.expires_at <= now,
+                )
+                if connection.execute(statement).rowcount:
+                    self.worker_id = worker_id
+                    return
+        raise RuntimeError("Every Snowflake worker id is leased")
+
+
+class SnowflakeGenerator:
+    """Time-ordered 64-bit ids: 41 bits of milliseconds, 10 of worker, 12 of sequence.
+
+    Ids from one worker are strictly increasing and ids from different workers
+    sort by creation time to the millisecond, so ``ORDER BY id`` is creation
+    order. Every process needs a distinct ``worker_id``, fixed or leased.
+    """
+
+    def __init__(self, worker_id: int | WorkerLease) -> None:
+        if isinstance(worker_id, int) and not 0 <= worker_id < 1 << WORKER_ID_BITS:
+            raise ValueError(f"worker_id must fit in {WORKER_ID_BITS} bits")
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def __call__(self) -> int:
+        worker_id = self.worker_id
+        if isinstance(worker_id, WorkerLease):
+            worker_id = worker_id.current()
+        with self._lock:
+            now_ms = max(time.time_ns() // 1_000_000, self._last_ms)
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    while now_ms <= self._last_ms:
+                        now_ms = time.time_ns() // 1_000_000
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+
+            return (
+                (now_ms - EPOCH_MS) << (WORKER_ID_BITS + SEQUENCE_BITS)
+                | worker_id << SEQUENCE_BITS
+                | self._sequence
+            )
+
+
+def created_at(snowflake_id: int) -> datetime:
+    ms = (snowflake_id >> (WORKER_ID_BITS + SEQUENCE_BITS)) + EPOCH_MS
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+
+next_id = SnowflakeGenerator(
+    WorkerLease(engine) if SNOWFLAKE_WORKER_ID is None else SNOWFLAKE_WORKER_ID
+)
+
+
+def renew_lease() -> None:
+    """Lease or renew the worker id of ``next_id``, if it has no fixed one."""
+    if SNOWFLAKE_IDS and isinstance(next_id.worker_id, WorkerLease):
+        next_id.worker_id.renew()
@@ -1,39 +1,87 @@
-from datetime import datetime
-
-from sqlalchemy import Column, Integer, Boolean, DateTime, String, ForeignKey
+from sqlalchemy import (
+    Column,
+    Integer,
+    BigInteger,
+    Boolean,
+    DateTime,
+    String,
+    ForeignKey,
+    Float,
+    Index,
+    func,
+)
 from sqlalchemy.orm import relationship
 
 from db.engine import Base
+from db.ids import SNOWFLAKE_IDS, next_id
+
+# SQLite only autoincrements a column declared exactly as INTEGER, which is
+# 64-bit there anyway.
+ContentId = BigInteger().with_variant(Integer, "sqlite")
 
 
 class Post(Base):
     __tablename__ = "posts"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(
+        ContentId,
+        primary_key=True,
+        index=True,
+        default=next_id if SNOWFLAKE_IDS else None,
+    )
     author_id = Column(Integer, ForeignKey("users.id"))
     title = Column(String, nullable=False)
     text = Column(String, nullable=False)
-    date_time_created = Column(DateTime, default=datetime.utcnow(), nullable=False)
+    date_time_created = Column(DateTime, server_default=func.now(), nullable=False)
     is_blocked = Column(Boolean, default=False)
     auto_reply = Column(Boolean, default=False)
     auto_reply_time = Column(Integer, default=0)
+    deleted_at = Column(DateTime, nullable=True, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    moderation_status = Column(
+        String,
+        nullable=False,
+        default="approved",
+        server_default="approved",
+        index=True,
+    )
 
     author = relationship("User", back_populates="posts")
 
+    # Ids grow with creation time, so this serves an author's posts newest
+    # first, paged by id, without touching other authors' rows.
+    __table_args__ = (Index("ix_posts_author_id_id", "author_id", "id"),)
+
 
 class Comment(Base):
     __tablename__ = "comments"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(
+        ContentId,
+        primary_key=True,
+        index=True,
+        default=next_id if SNOWFLAKE_IDS else None,
+    )
     author_id = Column(Integer, ForeignKey("users.id"))
     text = Column(String, nullable=False)
-    date_time_created = Column(DateTime, default=datetime.utcnow(), nullable=False)
+    date_time_created = Column(DateTime, server_default=func.now(), nullable=False)
     is_blocked = Column(Boolean, default=False)
-    post_id = Column(Integer, ForeignKey("posts.id"))
+    post_id = Column(ContentId, ForeignKey("posts.id"))
+    deleted_at = Column(DateTime, nullable=True, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    moderation_status = Column(
+        String,
+        nullable=False,
+        default="approved",
+        server_default="approved",
+        index=True,
+    )
 
     post = relationship(Post)
     author = relationship("User", back_populates="comments")
 
+    __table_args__ = (Index("ix_comments_author_id_id", "author_id", "id"),)
+
 
 class User(Base):
     __tablename__ = "users"
@@ -41,6 +89,101 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
+    follower_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     posts = relationship("Post", back_populates="author")
     comments = relationship("Comment", back_populates="author")
+
+
+class Follow(Base):
+    __tablename__ = "follows"
+
+    follower_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    followee_id = Column(Integer, ForeignKey("users.id"), primary_key=True, index=True)
+    date_time_created = Column(DateTime, server_default=func.now(), nullable=False)
+
+
+class TimelineEntry(Base):
+    __tablename__ = "timeline_entries"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    post_id = Column(ContentId, ForeignKey("posts.id"), primary_key=True, index=True)
+    author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+
+class PostActivity(Base):
+    __tablename__ = "post_activity"
+
+    post_id = Column(ContentId, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False)
+    updated_at = Column(Float, nullable=False, index=True)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=True)
+    response = Column(String, nullable=True)
+    expires_at = Column(Float, nullable=False, index=True)
+
+
+class Counter(Base):
+    __tablename__ = "counters"
+
+    name = Column(String, primary_key=True)
+    # The post whose comments are counted, 0 for overall counters.
+    post_id = Column(BigInteger, primary_key=True, default=0)
+    stripe = Column(Integer, primary_key=True)
+    total = Column(BigInteger, nullable=False, default=0)
+    blocked = Column(BigInteger, nullable=False, default=0)
+
+
+class AuthorStats(Base):
+    __tablename__ = "author_stats"
+
+    # Comment counts are kept on the comment shards, which have no users.
+    author_id = Column(Integer, primary_key=True)
+    posts = Column(BigInteger, nullable=False, default=0)
+    blocked_posts = Column(BigInteger, nullable=False, default=0)
+    comments = Column(BigInteger, nullable=False, default=0)
+    blocked_comments = Column(BigInteger, nullable=False, default=0)
+    last_active_at = Column(DateTime, nullable=True)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    expires_at = Column(Float, nullable=False, index=True)
+    revoked_at = Column(Float, nullable=False, index=True)
+
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+
+
+class Event(Base):
+    __tablename__ = "events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    channel = Column(String, nullable=False, index=True)
+    type = Column(String, nullable=False)
+    data = Column(String, nullable=False)
+    created_at = Column(Float, nullable=False, index=True)
+
+
+class SnowflakeWorker(Base):
+    __tablename__ = "snowflake_workers"
+
+    worker_id = Column(Integer, primary_key=True, autoincrement=False)
+    holder = Column(String, nullable=False)
+    expires_at = Column(Float, nullable=False)
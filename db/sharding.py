@@ -0,0 +1,238 @@
+"""Horizontal sharding of the ``comments`` table by ``post_id``.
+
+``COMMENT_SHARD_URLS`` lists the shard databases. When it is empty comments
+stay in the main database and every helper here is a pass-through, so the
+unsharded setup pays nothing. All comments of a post live on one shard, so
+per-post reads and writes touch exactly one database; queries spanning posts
+fan out to every shard concurrently.
+
+Usage::
+
+    python -m db.sharding init
+    python -m db.sharding rebalance [--urls URL [URL ...]] [--keep-source]
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, TypeVar
+
+from dotenv import load_dotenv
+from sqlalchemy import MetaData, create_engine, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from db import models
+from db.engine import SQLALCHEMY_DATABASE_URL, engine
+from db.ids import SNOWFLAKE_IDS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+COMMENT_SHARD_URLS = [
+    url for url in os.getenv("COMMENT_SHARD_URLS", "").split(",") if url
+]
+REBALANCE_BATCH_SIZE = 1000
+
+
+def create_shard_engine(url: str) -> Engine:
+    if url == SQLALCHEMY_DATABASE_URL:
+        return engine
+    if url.startswith("sqlite"):
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return create_engine(url)
+
+
+shard_sessions = [
+    sessionmaker(autocommit=False, autoflush=False, bind=create_shard_engine(url))
+    for url in COMMENT_SHARD_URLS
+]
+
+if shard_sessions and not SNOWFLAKE_IDS:
+    raise RuntimeError(
+        "COMMENT_SHARD_URLS requires SNOWFLAKE_IDS=1 so comment ids stay unique "
+        "across shards"
+    )
+
+_executor = ThreadPoolExecutor(max_workers=max(len(shard_sessions), 1))
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach).
+
+    Growing from ``n`` to ``n + 1`` buckets moves only ``1 / (n + 1)`` of
+    the keys, which keeps rebalancing cheap.
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for(post_id: int) -> int:
+    return jump_hash(post_id, len(shard_sessions))
+
+
+@contextmanager
+def comment_session(db: Session, post_id: int):
+    """Session for the shard holding the comments of ``post_id``."""
+    if not shard_sessions:
+        yield db
+        return
+
+    session = shard_sessions[shard_for(post_id)]()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@contextmanager
+def comment_sessions(db: Session):
+    """One session per comment shard, for jobs that walk the shards in turn."""
+    if not shard_sessions:
+        yield [db]
+        return
+
+    sessions = [factory() for factory in shard_sessions]
+    try:
+        yield sessions
+    finally:
+        for session in sessions:
+            session.close()
+
+
+def fan_out(db: Session, func: Callable[[Session], T]) -> list[T]:
+    """Run ``func`` against every comment shard concurrently."""
+    if not shard_sessions:
+        return [func(db)]
+
+    def run(factory: Callable[[], Session]) -> T:
+        with factory() as session:
+            return func(session)
+
+    return list(_executor.map(run, shard_sessions))
+
+
+def shard_table(metadata: MetaData):
+    """The ``comments`` table without foreign keys to tables on other databases."""
+    table = models.Comment.__table__.to_metadata(metadata)
+    for constraint in list(table.foreign_key_constraints):
+        table.constraints.discard(constraint)
+    for column in table.columns:
+        column.foreign_keys.clear()
+    return table
+
+
+def init_shards(urls: list[str]) -> None:
+    for url in urls:
+        bind = create_shard_engine(url)
+        metadata = MetaData()
+        shard_table(metadata).create(bind, checkfirst=True)
+        # Comment counters are kept next to the comments they count.
+        for table in (models.Counter.__table__, models.AuthorStats.__table__):
+            table.to_metadata(metadata).create(bind, checkfirst=True)
+
+
+def _upsert(bind: Engine, rows: list[dict]) -> None:
+    insert = postgresql.insert if bind.dialect.name == "postgresql" else sqlite.insert
+    table = models.Comment.__table__
+    statement = insert(table).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={column.name: statement.excluded[column.name] for column in table.columns},
+        where=table.c.version < statement.excluded.version,
+    )
+    with bind.begin() as connection:
+        connection.execute(statement)
+
+
+def rebalance(source_urls: list[str], target_urls: list[str], keep_source: bool) -> int:
+    """Move every comment to the shard ``target_urls`` assigns it.
+
+    Rows are copied in batches with a version-guarded upsert, then deleted
+    from their old shard unless ``keep_source`` is set. Copying first and
+    deleting in a second run lets the new shard list be deployed in between
+    without comments disappearing from reads.
+    """
+    table = models.Comment.__table__
+    targets = [create_shard_engine(url) for url in target_urls]
+    moved = 0
+
+    for source_url in source_urls:
+        source = create_shard_engine(source_url)
+        last_id = 0
+        while True:
+            with source.connect() as connection:
+                rows = connection.execute(
+                    select(table)
+                    .where(table.c.id > last_id)
+                    .order_by(table.c.id)
+                    .limit(REBALANCE_BATCH_SIZE)
+                ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            by_target = {}
+            for row in rows:
+                target = target_urls[jump_hash(row.post_id, len(target_urls))]
+                if target != source_url:
+                    by_target.setdefault(target, []).append(row._asdict())
+
+            for target_url, misplaced in by_target.items():
+                _upsert(targets[target_urls.index(target_url)], misplaced)
+                if not keep_source:
+                    with source.begin() as connection:
+                        connection.execute(
+                            delete(table).where(
+                                table.c.id.in_([row["id"] for row in misplaced])
+                            )
+                        )
+                moved += len(misplaced)
+            logger.info("%s: scanned up to id %s, moved %s", source_url, last_id, moved)
+
+    return moved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage comment shards")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("init", help="Create the comments table on every shard")
+    rebalance_parser = subparsers.add_parser(
+        "rebalance", help="Move comments to the shards given by --urls"
+    )
+    rebalance_parser.add_argument(
+        "--urls", nargs="+", default=COMMENT_SHARD_URLS, help="Target shard list"
+    )
+    rebalance_parser.add_argument(
+        "--keep-source",
+        action="store_true",
+        help="Only copy; leave moved rows on their old shard",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.command == "init":
+        init_shards(COMMENT_SHARD_URLS)
+        return
+
+    init_shards(args.urls)
+    sources = list(
+        dict.fromkeys((COMMENT_SHARD_URLS or [SQLALCHEMY_DATABASE_URL]) + args.urls)
+    )
+    moved = rebalance(sources, args.urls, args.keep_source)
+    logger.info("Rebalanced %s comments", moved)
+
+
+if __name__ == "__main__":
+    main()
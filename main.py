@@ -1,22 +1,264 @@
+import asyncio
+import math
+from contextlib import asynccontextmanager
 from datetime import timedelta
-from typing import List
-
-from fastapi import FastAPI, Depends, status, HTTPException
+from typing import Callable, List
+
+from fastapi import (
+    FastAPI,
+    Depends,
+    status,
+    HTTPException,
+    Query,
+    Request,
+    Header,
+    Response,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import jwt, JWTError
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
+from db import ids
 from db.engine import SessionLocal
 
-from app import crud as app_crud, schemas as app_schemas
-from db.models import User
-from user import crud as user_crud, schemas as user_schemas, auth
+from app import (
+    crud as app_crud,
+    schemas as app_schemas,
+    archive,
+    background,
+    compaction,
+    compression,
+    counters,
+    events,
+    feed,
+    idempotency,
+    moderation,
+    moderation_worker,
+    profiler,
+    rate_limit,
+    spam,
+    trending,
+)
+from db.models import Comment, User
+from user import crud as user_crud, schemas as user_schemas, auth, revocation
 from user.auth import SECRET_KEY, ALGORITHM
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [
+        background.PeriodicTask(
+            "compaction", compaction.COMPACTION_INTERVAL, compaction.run_compaction
+        ),
+    ]
+    tasks.append(
+        background.PeriodicTask(
+            "timeline trimming", feed.FEED_TRIM_INTERVAL, feed.run_trimming
+        )
+    )
+    tasks.append(
+        background.PeriodicTask(
+            "trending", trending.TRENDING_SYNC_INTERVAL, trending.ranking.sync
+        )
+    )
+    tasks.append(
+        background.PeriodicTask(
+            "event pruning", events.EVENT_PRUNE_INTERVAL, events.broker.prune
+        )
+    )
+    tasks.append(
+        background.PeriodicTask(
+            "token revocation cleanup",
+            revocation.REVOCATION_CLEANUP_INTERVAL,
+            revocation.run_cleanup,
+        )
+    )
+    tasks.append(
+        background.PeriodicTask(
+            "idempotency cleanup",
+            idempotency.IDEMPOTENCY_CLEANUP_INTERVAL,
+            idempotency.store.purge_expired,
+        )
+    )
+    if ids.SNOWFLAKE_IDS:
+        # Ids are only generated once a worker id is leased.
+        ids.renew_lease()
+        tasks.append(
+            background.PeriodicTask(
+                "snowflake lease", ids.SNOWFLAKE_LEASE_SECONDS / 3, ids.renew_lease
+            )
+        )
+    if counters.RUN_COUNTER_RECONCILIATION:
+        tasks.append(
+            background.PeriodicTask(
+                "counter reconciliation",
+                counters.COUNTER_RECONCILE_INTERVAL,
+                counters.run_reconciliation,
+            )
+        )
+    if archive.RUN_ARCHIVAL:
+        tasks.append(
+            background.PeriodicTask(
+                "archival", archive.ARCHIVE_INTERVAL, archive.run_archival
+            )
+        )
+    if (
+        moderation.MODERATION_MODE == "deferred"
+        and moderation_worker.RUN_MODERATION_WORKER
+    ):
+        tasks.append(
+            background.PeriodicTask(
+                "moderation",
+                moderation_worker.MODERATION_INTERVAL,
+                moderation_worker.run_moderation,
+            )
+        )
+    for task in tasks:
+        task.start()
+    yield
+    for task in tasks:
+        task.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(compression.CompressionMiddleware)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+MAX_PAGE_SIZE = 100
+
+
+@app.exception_handler(rate_limit.RateLimitExceeded)
+def rate_limit_exceeded_handler(
+    request: Request, exc: rate_limit.RateLimitExceeded
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
+@app.exception_handler(app_crud.VersionConflictError)
+def version_conflict_handler(
+    request: Request, exc: app_crud.VersionConflictError
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        content={"detail": "Resource was modified by another request"},
+    )
+
+
+@app.exception_handler(app_crud.ArchivedCommentError)
+def archived_comment_handler(
+    request: Request, exc: app_crud.ArchivedCommentError
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_410_GONE,
+        content={"detail": "Comment is archived and can no longer be changed"},
+    )
+
+
+@app.exception_handler(app_crud.PostNotFoundError)
+def post_not_found_handler(
+    request: Request, exc: app_crud.PostNotFoundError
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_404_NOT_FOUND, content={"detail": "Post not found"}
+    )
+
+
+@app.exception_handler(idempotency.IdempotencyKeyReused)
+def idempotency_key_reused_handler(
+    request: Request, exc: idempotency.IdempotencyKeyReused
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        content={"detail": "Idempotency-Key was already used for a different request"},
+    )
+
+
+@app.exception_handler(idempotency.IdempotencyKeyInProgress)
+def idempotency_key_in_progress_handler(
+    request: Request, exc: idempotency.IdempotencyKeyInProgress
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content={"detail": "A request with this Idempotency-Key is still running"},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(spam.SpamDetected)
+def spam_detected_handler(request: Request, exc: spam.SpamDetected) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "Too many copies of this comment were posted recently"},
+    )
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def parse_if_match(if_match: str | None) -> int | None:
+    if if_match is None or if_match.strip() == "*":
+        return None
+    try:
+        return int(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="If-Match must be an ETag returned by this API",
+        )
+
+
+def idempotent(
+    request: Request,
+    idempotency_key: str | None,
+    user_id: int,
+    body: BaseModel,
+    status_code: int,
+    schema: type[BaseModel],
+    create: Callable[[], object],
+    scope: str,
+) -> BaseModel | JSONResponse:
+    """Run ``create`` once per ``Idempotency-Key`` and replay its response.
+
+    The rate limits of ``scope`` are only charged when ``create`` runs, so
+    replaying a stored response costs a retrying client nothing.
+    """
+    if idempotency_key is None:
+        charge_rate_limits(scope, user_id)
+        return create()
+
+    request_fingerprint = idempotency.fingerprint(
+        request.method, request.url.path, body.model_dump(mode="json")
+    )
+    stored = idempotency.store.begin(user_id, idempotency_key, request_fingerprint)
+    if stored is not None:
+        stored_status_code, content = stored
+        return JSONResponse(
+            status_code=stored_status_code,
+            content=content,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    try:
+        charge_rate_limits(scope, user_id)
+        result = schema.model_validate(create(), from_attributes=True)
+    except BaseException:
+        idempotency.store.release(user_id, idempotency_key)
+        raise
+    idempotency.store.complete(
+        user_id, idempotency_key, status_code, result.model_dump(mode="json")
+    )
+    return result
+
 
 def get_db() -> Session:
     db = SessionLocal()
@@ -43,6 +285,10 @@ def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    # Tokens issued before revocation was introduced carry no jti.
+    jti = payload.get("jti")
+    if jti is not None and revocation.revocations.is_revoked(db, jti):
+        raise credentials_exception
 
     user = user_crud.get_user_by_email(db, email=email)
     if user is None:
@@ -50,6 +296,27 @@ def get_current_user(
     return user
 
 
+def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    if not auth.is_admin(current_user.email):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return current_user
+
+
+def charge_rate_limits(scope: str, user_id: int) -> None:
+    rate_limit.hit("user", user_id)
+    rate_limit.hit(scope, user_id)
+
+
+def rate_limited(scope: str):
+    def dependency(current_user: User = Depends(get_current_user)) -> None:
+        charge_rate_limits(scope, current_user.id)
+
+    return dependency
+
+
 @app.post(
     "/register/",
     response_model=user_schemas.UserResponse,
@@ -84,41 +351,276 @@ def login(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+def revoke_token(db: Session, payload: dict, user_id: int) -> None:
+    if payload.get("jti") is not None:
+        revocation.revocations.revoke(
+            db, jti=payload["jti"], user_id=user_id, expires_at=payload["exp"]
+        )
+
+
+@app.post("/logout/", status_code=status.HTTP_204_NO_CONTENT)
+def logout(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> None:
+    revoke_token(
+        db, jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]), current_user.id
+    )
+
+
+@app.post("/token/revoke/", status_code=status.HTTP_204_NO_CONTENT)
+def revoke(
+    body: user_schemas.TokenRevoke,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> None:
+    try:
+        payload = jwt.decode(body.token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        # An invalid or expired token cannot be used anyway.
+        return
+    if payload.get("sub") != current_user.email and not auth.is_admin(
+        current_user.email
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only the owner of a token or an admin can revoke it",
+        )
+    owner = user_crud.get_user_by_email(db, email=payload.get("sub"))
+    if owner is not None:
+        revoke_token(db, payload, owner.id)
+
+
+def parse_fields(fields: str | None, schema: type[BaseModel]) -> list[str] | None:
+    """Validate ``?fields=a,b`` against ``schema``; ``id`` is always included."""
+    if fields is None:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in schema.model_fields]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"fields must be a comma-separated subset of "
+            f"{', '.join(schema.model_fields)}",
+        )
+    return list(dict.fromkeys(["id", *requested]))
+
+
+def sparse_response(response: Response, content, fields: list[str]) -> JSONResponse:
+    """Serialize only ``fields`` of ``content``, keeping the headers already set."""
+    if isinstance(content, list):
+        data = [{field: getattr(item, field) for field in fields} for item in content]
+    else:
+        data = {field: getattr(content, field) for field in fields}
+    sparse = JSONResponse(content=jsonable_encoder(data))
+    sparse.headers.update(response.headers)
+    return sparse
+
+
+def set_next_cursor(response: Response, page: list, limit: int | None) -> None:
+    if limit is not None and len(page) == limit:
+        response.headers["X-Next-Cursor"] = str(page[-1].id)
+
+
 @app.get("/posts/", response_model=list[app_schemas.Post])
 def get_posts(
-    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+    response: Response,
+    cursor: int | None = None,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: str | None = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
 ) -> List[app_schemas.Post]:
-    return app_crud.get_all_posts(db=db)
+    selected = parse_fields(fields, app_schemas.Post)
+    posts = app_crud.get_all_posts(
+        db=db, viewer_id=current_user.id, cursor=cursor, limit=limit, fields=selected
+    )
+    set_next_cursor(response, posts, limit)
+    response.headers["X-Total-Count"] = str(
+        app_crud.total_posts(db, viewer_id=current_user.id)
+    )
+    if selected:
+        return sparse_response(response, posts, selected)
+    return posts
+
+
+@app.get("/feed/", response_model=list[app_schemas.Post])
+def get_feed(
+    response: Response,
+    cursor: int | None = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> List[app_schemas.Post]:
+    posts = feed.get_feed(db=db, user_id=current_user.id, cursor=cursor, limit=limit)
+    set_next_cursor(response, posts, limit)
+    return posts
+
+
+@app.post("/users/{user_id}/follow", status_code=status.HTTP_204_NO_CONTENT)
+def follow_user(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> None:
+    if user_id == current_user.id:
+        raise HTTPException(status_code=400, detail="Users cannot follow themselves")
+    get_user_or_404(db, user_id)
+    feed.follow(db=db, follower_id=current_user.id, followee_id=user_id)
+
+
+@app.delete("/users/{user_id}/follow", status_code=status.HTTP_204_NO_CONTENT)
+def unfollow_user(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> None:
+    feed.unfollow(db=db, follower_id=current_user.id, followee_id=user_id)
+
+
+def get_user_or_404(db: Session, user_id: int) -> User:
+    user = db.get(User, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+@app.get("/users/{user_id}/posts", response_model=list[app_schemas.Post])
+def get_user_posts(
+    user_id: int,
+    response: Response,
+    cursor: int | None = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> List[app_schemas.Post]:
+    get_user_or_404(db, user_id)
+    posts = app_crud.get_all_posts(
+        db=db,
+        viewer_id=current_user.id,
+        cursor=cursor,
+        limit=limit,
+        author_id=user_id,
+    )
+    set_next_cursor(response, posts, limit)
+    return posts
+
+
+@app.get("/users/{user_id}/comments", response_model=list[app_schemas.Comment])
+def get_user_comments(
+    user_id: int,
+    response: Response,
+    cursor: int | None = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> List[app_schemas.Comment]:
+    get_user_or_404(db, user_id)
+    comments = app_crud.get_all_comments(
+        db=db,
+        viewer_id=current_user.id,
+        cursor=cursor,
+        limit=limit,
+        author_id=user_id,
+    )
+    set_next_cursor(response, comments, limit)
+    return comments
+
+
+@app.get("/users/{user_id}/stats", response_model=app_schemas.AuthorStats)
+def get_user_stats(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> dict:
+    get_user_or_404(db, user_id)
+    return app_crud.get_author_stats(db=db, author_id=user_id)
 
 
 @app.post(
-    "/posts/", response_model=app_schemas.Post, status_code=status.HTTP_201_CREATED
+    "/posts/",
+    response_model=app_schemas.Post,
+    status_code=status.HTTP_201_CREATED,
 )
 def create_post(
     post: app_schemas.PostCreate,
+    request: Request,
+    idempotency_key: str | None = Header(None, max_length=255),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> app_schemas.Post:
-    return app_crud.create_post(db=db, post=post, author_id=current_user.id)
+    return idempotent(
+        request,
+        idempotency_key,
+        current_user.id,
+        post,
+        status.HTTP_201_CREATED,
+        app_schemas.Post,
+        lambda: app_crud.create_post(db=db, post=post, author_id=current_user.id),
+        scope="posts",
+    )
 
 
-@app.put("/posts/{post_id}", response_model=app_schemas.Post)
+@app.get("/posts/trending", response_model=list[app_schemas.TrendingPost])
+def get_trending_posts(
+    limit: int = Query(20, ge=1, le=trending.TRENDING_TOP_K),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+) -> list[dict]:
+    return [
+        {"post": post, "score": score}
+        for post, score in app_crud.get_trending_posts(
+            db=db, viewer_id=current_user.id, limit=limit
+        )
+    ]
+
+
+@app.put(
+    "/posts/{post_id}",
+    response_model=app_schemas.Post,
+    dependencies=[Depends(rate_limited("posts"))],
+)
 def update_post(
     post_id: int,
     post: app_schemas.PostCreate,
+    response: Response,
+    if_match: str | None = Header(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> app_schemas.Post:
-    return app_crud.update_post(db=db, post_id=post_id, post=post)
+    db_post = app_crud.update_post(
+        db=db, post_id=post_id, post=post, version=parse_if_match(if_match)
+    )
+    if db_post is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+
+    response.headers["ETag"] = etag(db_post.version)
+    return db_post
 
 
 @app.get("/posts/{post_id}", response_model=app_schemas.Post)
 def get_post_by_id(
     post_id: int,
+    response: Response,
+    fields: str | None = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> app_schemas.Post:
-    return app_crud.get_post_by_id(db=db, post_id=post_id)
+    selected = parse_fields(fields, app_schemas.Post)
+    db_post = app_crud.get_post_by_id(
+        db=db,
+        post_id=post_id,
+        viewer_id=current_user.id,
+        fields=selected and [*selected, "version"],
+    )
+    if db_post is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+
+    response.headers["ETag"] = etag(db_post.version)
+    if selected:
+        return sparse_response(response, db_post, selected)
+    return db_post
 
 
 @app.delete("/posts/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -127,16 +629,73 @@ def delete_post(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> None:
-    return app_crud.delete_post(db=db, post_id=post_id)
+    if not app_crud.delete_post(db=db, post_id=post_id):
+        raise HTTPException(status_code=404, detail="Post not found")
 
 
 @app.get("/comments/", response_model=list[app_schemas.Comment])
 def get_comments(
+    response: Response,
     post_id: int | None = None,
+    cursor: int | None = None,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: str | None = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> List[app_schemas.Comment]:
-    return app_crud.get_all_comments(db=db, post_id=post_id)
+    selected = parse_fields(fields, app_schemas.Comment)
+    comments = app_crud.get_all_comments(
+        db=db,
+        post_id=post_id,
+        viewer_id=current_user.id,
+        cursor=cursor,
+        limit=limit,
+        fields=selected,
+    )
+    set_next_cursor(response, comments, limit)
+    response.headers["X-Total-Count"] = str(
+        app_crud.total_comments(db, viewer_id=current_user.id, post_id=post_id)
+    )
+    if selected:
+        return sparse_response(response, comments, selected)
+    return comments
+
+
+@app.get("/posts/{post_id}/comments/stream")
+async def stream_comments(
+    post_id: int,
+    request: Request,
+    last_event_id: int | None = Header(None),
+    current_user: User = Depends(get_current_user),
+) -> StreamingResponse:
+    subscription = await run_in_threadpool(
+        events.broker.subscribe,
+        events.comment_channel(post_id),
+        asyncio.get_running_loop(),
+        last_event_id,
+    )
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.get(), events.EVENT_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield event.encode()
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
 
 @app.post(
@@ -146,29 +705,80 @@ def get_comments(
 )
 def create_comment(
     comment: app_schemas.CommentCreate,
+    request: Request,
+    idempotency_key: str | None = Header(None, max_length=255),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> app_schemas.Comment:
-    return app_crud.create_comment(db=db, comment=comment, author_id=current_user.id)
+    def create() -> Comment:
+        post = app_crud.get_post_by_id(db=db, post_id=comment.post_id)
+        if post is not None and post.auto_reply:
+            rate_limit.hit("ai", current_user.id)
+
+        return app_crud.create_comment(
+            db=db, comment=comment, author_id=current_user.id
+        )
+
+    return idempotent(
+        request,
+        idempotency_key,
+        current_user.id,
+        comment,
+        status.HTTP_201_CREATED,
+        app_schemas.Comment,
+        create,
+        scope="comments",
+    )
 
 
-@app.put("/comments/{comment_id}", response_model=app_schemas.Comment)
+@app.put(
+    "/comments/{comment_id}",
+    response_model=app_schemas.Comment,
+    dependencies=[Depends(rate_limited("comments"))],
+)
 def update_comment(
     comment_id: int,
     comment: app_schemas.CommentCreate,
+    response: Response,
+    if_match: str | None = Header(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> app_schemas.Comment:
-    return app_crud.update_comment(db=db, comment_id=comment_id, comment=comment)
+    db_comment = app_crud.update_comment(
+        db=db,
+        comment_id=comment_id,
+        comment=comment,
+        version=parse_if_match(if_match),
+    )
+    if db_comment is None:
+        raise HTTPException(status_code=404, detail="Comment not found")
+
+    response.headers["ETag"] = etag(db_comment.version)
+    return db_comment
 
 
 @app.get("/comments/{comment_id}", response_model=app_schemas.Comment)
 def get_comment_by_id(
     comment_id: int,
+    response: Response,
+    fields: str | None = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> app_schemas.Comment:
-    return app_crud.get_comment_by_id(db=db, comment_id=comment_id)
+    selected = parse_fields(fields, app_schemas.Comment)
+    db_comment = app_crud.get_comment_by_id(
+        db=db,
+        comment_id=comment_id,
+        viewer_id=current_user.id,
+        fields=selected and [*selected, "version"],
+    )
+    if db_comment is None:
+        raise HTTPException(status_code=404, detail="Comment not found")
+
+    response.headers["ETag"] = etag(db_comment.version)
+    if selected:
+        return sparse_response(response, db_comment, selected)
+    return db_comment
 
 
 @app.delete("/comments/{comment_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -177,7 +787,8 @@ def delete_comment(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ) -> None:
-    return app_crud.delete_comment(db=db, comment_id=comment_id)
+    if not app_crud.delete_comment(db=db, comment_id=comment_id):
+        raise HTTPException(status_code=404, detail="Comment not found")
 
 
 @app.get("/comments-daily-breakdown/", response_model=List[dict])
@@ -188,3 +799,20 @@ def get_comments_daily_breakdown(
     current_user: User = Depends(get_current_user),
 ) -> List[dict]:
     return app_crud.comments_analysis(db=db, date_from=date_from, date_to=date_to)
+
+
+@app.post("/admin/profile/", response_model=None)
+def profile_worker(
+    seconds: float = Query(5, gt=0, le=profiler.MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    output: str = Query("json", pattern="^(json|collapsed)$"),
+    current_user: User = Depends(get_current_admin),
+) -> dict | PlainTextResponse:
+    try:
+        result = profiler.profile(seconds=seconds, interval=interval_ms / 1000)
+    except profiler.ProfilerBusyError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error))
+
+    if output == "collapsed":
+        return PlainTextResponse(result["collapsed"])
+    return result
@@ -0,0 +1,61 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import compression
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(compression, "budget", compression.CpuBudget(1))
+    monkeypatch.setattr(compression, "cache", compression.CompressedCache(1024 * 1024))
+    app = FastAPI()
+    app.add_middleware(compression.CompressionMiddleware)
+
+    @app.get("/page")
+    def page() -> list[dict]:
+        return [{"id": index, "text": "Test comment"} for index in range(100)]
+
+    @app.get("/small")
+    def small() -> dict:
+        return {"id": 1}
+
+    return TestClient(app)
+
+
+def test_negotiate():
+    assert compression.negotiate("gzip, deflate") == "gzip"
+    assert compression.negotiate("deflate, *;q=0.5") == "gzip"
+    assert compression.negotiate("gzip;q=0, identity") is None
+    assert compression.negotiate("") is None
+
+
+def test_large_responses_are_compressed_once(client, monkeypatch):
+    compressed = []
+    compress = compression.compress
+    monkeypatch.setattr(
+        compression,
+        "compress",
+        lambda encoding, body: compressed.append(encoding) or compress(encoding, body),
+    )
+
+    for _ in range(2):
+        response = client.get("/page", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert len(response.json()) == 100
+    assert compressed == ["gzip"]
+
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    response = client.get("/page", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_exhausted_cpu_budget_skips_compression(client, monkeypatch):
+    monkeypatch.setattr(compression, "budget", compression.CpuBudget(0, burst=0))
+
+    response = client.get("/page", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in response.headers
+    assert len(response.json()) == 100
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from sqlalchemy import create_engine, func, select
+
+from app.events import EVENT_RETENTION, MemoryBroker, SQLBroker
+from db.engine import Base
+from db.models import Event
+
+
+async def _collect(subscription, count):
+    return [await asyncio.wait_for(subscription.get(), 1) for _ in range(count)]
+
+
+def test_memory_broker_delivers_to_subscribers():
+    async def scenario():
+        broker = MemoryBroker()
+        subscription = broker.subscribe("post:1", asyncio.get_running_loop())
+        broker.publish("post:2", "comment.created", {"id": 1})
+        broker.publish("post:1", "comment.created", {"id": 2})
+        events = await _collect(subscription, 1)
+        subscription.close()
+        return events
+
+    events = asyncio.run(scenario())
+    assert [event.data for event in events] == [{"id": 2}]
+
+
+def test_memory_broker_resumes_from_last_event_id():
+    async def scenario():
+        broker = MemoryBroker()
+        first = broker.publish("post:1", "comment.created", {"id": 1})
+        broker.publish("post:1", "comment.updated", {"id": 1})
+        broker.publish("post:1", "comment.deleted", {"id": 1})
+        subscription = broker.subscribe(
+            "post:1", asyncio.get_running_loop(), last_event_id=first.id
+        )
+        events = await _collect(subscription, 2)
+        subscription.close()
+        return events
+
+    events = asyncio.run(scenario())
+    assert [event.type for event in events] == ["comment.updated", "comment.deleted"]
+    assert events[0].encode().startswith(f"id: {events[0].id}\nevent: comment.updated")
+
+
+def test_brokers_prune_old_events(tmp_path):
+    memory = MemoryBroker()
+    memory.publish("post:1", "comment.created", {"id": 1})
+    memory.prune(now=time.time() + EVENT_RETENTION / 2)
+    assert list(memory._history) == ["post:1"]
+    memory.prune(now=time.time() + EVENT_RETENTION + 1)
+    assert memory._history == {}
+
+    bind = create_engine(f"sqlite:///{tmp_path}/events.db")
+    Base.metadata.create_all(bind)
+    sql = SQLBroker(bind)
+    sql.publish("post:1", "comment.created", {"id": 1})
+    sql.prune(now=time.time() + EVENT_RETENTION + 1)
+    with bind.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(Event)).scalar() == 0
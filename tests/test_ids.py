@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+import textwrap
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine
+
+from db.ids import (
+    WORKER_ID_BITS,
+    SEQUENCE_BITS,
+    SnowflakeGenerator,
+    WorkerLease,
+    created_at,
+)
+from db.models import SnowflakeWorker
+
+
+def test_snowflake_ids_are_increasing_and_unique():
+    next_id = SnowflakeGenerator(worker_id=1)
+    ids = [next_id() for _ in range(10000)]
+
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+
+
+def test_snowflake_ids_encode_creation_time():
+    snowflake_id = SnowflakeGenerator(worker_id=1023)()
+
+    assert abs(created_at(snowflake_id) - datetime.now(timezone.utc)) < timedelta(
+        seconds=1
+    )
+
+
+def test_worker_ids_are_leased_per_process(tmp_path, monkeypatch):
+    bind = create_engine(f"sqlite:///{tmp_path}/ids.db")
+    SnowflakeWorker.__table__.create(bind)
+    first, second = WorkerLease(bind, seconds=60), WorkerLease(bind, seconds=60)
+    first.renew()
+    second.renew()
+
+    assert (first.current(), second.current()) == (0, 1)
+    snowflake_id = SnowflakeGenerator(second)()
+    assert snowflake_id >> SEQUENCE_BITS & ((1 << WORKER_ID_BITS) - 1) == 1
+
+    # Lapsed leases go to the next process, and a process that lost its id
+    # moves to a free one.
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    third = WorkerLease(bind, seconds=60)
+    third.renew()
+    first.renew()
+    assert (third.current(), first.current()) == (0, 1)
+
+
+def test_posts_and_comments_get_snowflake_ids_on_sqlite(tmp_path):
+    # The id default runs while the session holds SQLite's write lock, so it
+    # must not touch the database; the flag is read at import, hence the
+    # separate interpreter.
+    script = textwrap.dedent("""
+        from app import crud, schemas
+        from db import ids
+        from db.engine import Base, SessionLocal, engine
+        from db.models import User
+
+        Base.metadata.create_all(engine)
+        ids.renew_lease()
+        db = SessionLocal()
+        db.add(User(id=1, email="1@1.com", hashed_password="x"))
+        db.commit()
+        post = crud.create_post(
+            db, schemas.PostCreate(title="t", text="t"), author_id=1
+        )
+        comment = crud.create_comment(
+            db, schemas.CommentCreate(text="c", post_id=post.id), author_id=1
+        )
+        assert post.id > 1 << 22 and comment.id > post.id
+        """)
+    env = {
+        **os.environ,
+        "SNOWFLAKE_IDS": "1",
+        "MODERATION_MODE": "deferred",
+        "PYTHONPATH": os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    }
+    subprocess.run(
+        [sys.executable, "-c", script], cwd=tmp_path, env=env, check=True, timeout=60
+    )
@@ -1,13 +1,31 @@
+import json
 from datetime import datetime, timedelta
 
 import pytest
-from sqlalchemy import create_engine, select
+from sqlalchemy import create_engine, event, select
 from sqlalchemy.orm import sessionmaker
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 
 from db.engine import Base
-from db.models import User
+from db.models import User, Post, Comment, Counter, IdempotencyKey, TimelineEntry
+from app import (
+    archive,
+    crud,
+    compaction,
+    counters,
+    events,
+    feed,
+    idempotency,
+    moderation,
+    moderation_worker,
+    rate_limit,
+    remoderation,
+    spam,
+    trending,
+)
 from main import app, get_db
+from user import auth, revocation
 
 SQLALCHEMY_TEST_DATABASE_URL = "sqlite:///./test.db"
 
@@ -53,6 +71,14 @@ def override_get_db(db):
     app.dependency_overrides[get_db] = _override_get_db
 
 
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    yield
+    rate_limit.backend.reset()
+    spam.index.reset()
+    revocation.revocations.reset()
+
+
 def create_test_user(client, email, password):
     user_data = {"email": email, "password": password}
     response = client.post("/register/", json=user_data)
@@ -86,6 +112,36 @@ def test_login(client, db, override_get_db):
     assert response.json()["token_type"] == "bearer"
 
 
+def test_logout_and_revoke_tokens(client, override_get_db):
+    create_test_user(client, "1@1.com", "test")
+    create_test_user(client, "2@2.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    other_token = get_auth_token(client, "1@1.com", "test")
+    stranger_token = get_auth_token(client, "2@2.com", "test")
+
+    response = client.post("/logout/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 204
+    response = client.get("/posts/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+    response = client.get("/posts/", headers={"Authorization": f"Bearer {other_token}"})
+    assert response.status_code == 200
+
+    response = client.post(
+        "/token/revoke/",
+        json={"token": other_token},
+        headers={"Authorization": f"Bearer {stranger_token}"},
+    )
+    assert response.status_code == 403
+    response = client.post(
+        "/token/revoke/",
+        json={"token": other_token},
+        headers={"Authorization": f"Bearer {other_token}"},
+    )
+    assert response.status_code == 204
+    response = client.get("/posts/", headers={"Authorization": f"Bearer {other_token}"})
+    assert response.status_code == 401
+
+
 def test_get_posts(client, override_get_db):
     create_test_user(client, "1@1.com", "test")
     token = get_auth_token(client, "1@1.com", "test")
@@ -198,6 +254,32 @@ def test_create_comment(client, override_get_db):
     assert response.status_code == 201
 
 
+def test_comment_flood_is_rejected_before_moderation(
+    client, override_get_db, monkeypatch
+):
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    checked = []
+    monkeypatch.setattr(moderation, "has_profanity", checked.append)
+
+    text = "Win a free phone today, just visit my profile and claim it"
+    for copy in range(spam.SPAM_AUTHOR_LIMIT):
+        response = client.post(
+            "/comments/",
+            json={"text": f"{text} {'!' * copy}", "post_id": 1},
+            headers=headers,
+        )
+        assert response.status_code == 201
+
+    response = client.post(
+        "/comments/", json={"text": text.upper(), "post_id": 1}, headers=headers
+    )
+    assert response.status_code == 429
+    assert len(checked) == spam.SPAM_AUTHOR_LIMIT
+
+
 def test_get_comments_with_post_id(client, override_get_db):
     email = "1@1.com"
     password = "test"
@@ -274,6 +356,32 @@ def test_update_comment(client, override_get_db):
     assert response.json()["text"] == "Updated Test comment"
 
 
+def test_update_counts_blocked_flips_in_one_statement(
+    client, db, override_get_db, monkeypatch
+):
+    monkeypatch.setattr(moderation, "has_profanity", lambda text: "Fuck" in text)
+    create_test_user(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {get_auth_token(client, '1@1.com', 'test')}"}
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    client.post("/comments/", json={"text": "Test", "post_id": 1}, headers=headers)
+
+    updates = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "UPDATE comments" in statement:
+            updates.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        for text, blocked in [("Fuck", 1), ("Fuck you", 1), ("Fine", 0)]:
+            comment = {"text": text, "post_id": 1}
+            assert client.put("/comments/1", json=comment, headers=headers).is_success
+            assert counters.read(db, counters.COMMENTS) == (1, blocked)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert len(updates) == 3
+
+
 def test_delete_comment(client, override_get_db):
     email = "1@1.com"
     password = "test"
@@ -367,3 +475,638 @@ def test_comments_analysis(client, override_get_db):
     assert response.json()[0]["day"] == date_from
     assert response.json()[0]["total_comments"] == 3
     assert response.json()[0]["blocked_comments"] == 1
+
+
+def test_profile_requires_admin(client, override_get_db):
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+
+    response = client.post(
+        "/admin/profile/?seconds=0.1", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 403
+
+
+def test_profile_worker(client, override_get_db, monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_EMAILS", {"admin@1.com"})
+    create_test_user(client, "admin@1.com", "test")
+    token = get_auth_token(client, "admin@1.com", "test")
+
+    response = client.post(
+        "/admin/profile/?seconds=0.1", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    assert response.json()["samples"] > 0
+    assert "collapsed" in response.json()
+    assert isinstance(response.json()["functions"], list)
+
+
+def test_rate_limit_post_writes(client, override_get_db, monkeypatch):
+    monkeypatch.setitem(rate_limit.LIMITS, "posts", rate_limit.parse_limit("1/60"))
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+
+    response = client.post(
+        "/posts/", json=DEFAULT_POST_DATA, headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 201
+
+    response = client.post(
+        "/posts/", json=DEFAULT_POST_DATA, headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+
+def test_memory_buckets_are_evicted_by_their_own_limit(monkeypatch):
+    monkeypatch.setattr(rate_limit, "MAX_MEMORY_BUCKETS", 2)
+    backend = rate_limit.MemoryBackend()
+    assert backend.take("ai:1", 1, 1 / 60, now=0) == 0
+    assert backend.take("user:1", 2, 2, now=0) == 0
+
+    # At t=1 the user bucket has refilled and is evicted; the slowly
+    # refilling AI bucket is still drained and must stay.
+    backend.take("user:2", 2, 2, now=1)
+    assert backend.take("ai:1", 1, 1 / 60, now=1) > 0
+
+
+def test_memory_buckets_are_swept_to_the_low_water_mark(monkeypatch):
+    monkeypatch.setattr(rate_limit, "MAX_MEMORY_BUCKETS", 20)
+    backend = rate_limit.MemoryBackend()
+    sweeps = []
+    evict_full = backend._evict_full
+
+    def sweep(now):
+        sweeps.append(now)
+        evict_full(now)
+
+    monkeypatch.setattr(backend, "_evict_full", sweep)
+    # Drained buckets that refill in 10, 20, ... 200 seconds.
+    for number in range(20):
+        backend.take(f"ai:{number}", 1, 1 / (10 * (number + 1)), now=0)
+
+    backend.take("ai:new", 1, 1, now=0)
+    assert len(sweeps) == 1
+    assert len(backend._buckets) == 19
+    # The buckets closest to full were dropped, the slowest kept.
+    assert {"ai:0", "ai:1"}.isdisjoint(backend._buckets)
+    assert "ai:19" in backend._buckets
+    backend.take("ai:other", 1, 1, now=0)
+    assert len(sweeps) == 1
+
+
+def test_delete_post_hides_post_and_comments(client, db, override_get_db):
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    client.post(
+        "/comments/", json={"text": "Test comment", "post_id": 1}, headers=headers
+    )
+
+    response = client.delete("/posts/1", headers=headers)
+    assert response.status_code == 204
+
+    assert client.get("/posts/", headers=headers).json() == []
+    assert client.get("/comments/", headers=headers).json() == []
+    assert client.delete("/posts/1", headers=headers).status_code == 404
+    assert db.get(Post, 1).deleted_at is not None
+
+    stats = client.get("/users/1/stats", headers=headers).json()
+    for post_id in [1, 2]:
+        response = client.post(
+            "/comments/", json={"text": "Late", "post_id": post_id}, headers=headers
+        )
+        assert response.status_code == 404
+    response = client.get("/comments/", headers=headers)
+    assert response.headers["X-Total-Count"] == "0"
+    assert client.get("/users/1/stats", headers=headers).json() == stats
+
+
+def test_compaction_purges_soft_deleted_rows(client, db, override_get_db):
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    client.post(
+        "/comments/", json={"text": "Test comment", "post_id": 1}, headers=headers
+    )
+    client.post(
+        "/comments/", json={"text": "Test comment", "post_id": 2}, headers=headers
+    )
+    client.post(
+        "/comments/", json={"text": "Test comment", "post_id": 2}, headers=headers
+    )
+    client.delete("/posts/1", headers=headers)
+    client.delete("/comments/2", headers=headers)
+
+    purged = compaction.compact(db, retention=timedelta(0), batch_size=1)
+
+    assert purged == {"posts": 1, "comments": 2}
+    assert db.query(Post).count() == 1
+    assert [comment.id for comment in db.query(Comment)] == [3]
+
+
+def test_archived_comments_stay_readable(
+    client, db, override_get_db, monkeypatch, tmp_path
+):
+    monkeypatch.setattr(archive, "archive", archive.Archive(str(tmp_path)))
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    for text in ["Test comment 1", "Fuck", "Test comment 3"]:
+        client.post("/comments/", json={"text": text, "post_id": 1}, headers=headers)
+
+    archived = archive.archive_comments(
+        db, datetime.utcnow() + timedelta(days=1), path=str(tmp_path), block_size=2
+    )
+    client.post(
+        "/comments/", json={"text": "Test comment 4", "post_id": 1}, headers=headers
+    )
+
+    assert archived == 2
+    assert [comment.id for comment in db.query(Comment)] == [3, 4]
+    assert client.get("/comments/1", headers=headers).json()["text"] == (
+        "Test comment 1"
+    )
+    response = client.get("/comments/?post_id=1&limit=2", headers=headers)
+    assert [comment["id"] for comment in response.json()] == [4, 3]
+    response = client.get(
+        f"/comments/?post_id=1&limit=2&cursor={response.headers['X-Next-Cursor']}",
+        headers=headers,
+    )
+    assert [comment["id"] for comment in response.json()] == [2, 1]
+    response = client.get("/users/1/comments", headers=headers)
+    assert [comment["id"] for comment in response.json()] == [4, 3, 2, 1]
+    assert counters.reconcile(db) == 0
+
+    # Indexes written before they recorded authors have their blocks scanned.
+    for index_path in tmp_path.glob("*.idx"):
+        index = json.loads(index_path.read_text())
+        for block in index["blocks"]:
+            del block["authors"]
+        index_path.write_text(json.dumps(index))
+    monkeypatch.setattr(archive, "archive", archive.Archive(str(tmp_path)))
+    response = client.get("/users/1/comments", headers=headers)
+    assert [comment["id"] for comment in response.json()] == [4, 3, 2, 1]
+    assert counters.reconcile(db) == 0
+
+    monkeypatch.setattr(archive, "ARCHIVE_UNPAGED_LIMIT", 1)
+    response = client.get("/comments/?post_id=1", headers=headers)
+    assert [comment["id"] for comment in response.json()] == [2, 3, 4]
+    response = client.put(
+        "/comments/1", json={"text": "Edited", "post_id": 1}, headers=headers
+    )
+    assert response.status_code == 410
+    assert client.delete("/comments/1", headers=headers).status_code == 410
+    assert client.delete("/comments/9", headers=headers).status_code == 404
+
+    date_from = datetime.today().strftime("%Y-%m-%d")
+    date_to = (datetime.today() + timedelta(days=1)).strftime("%Y-%m-%d")
+    response = client.get(
+        f"/comments-daily-breakdown/?date_from={date_from}&date_to={date_to}",
+        headers=headers,
+    )
+    assert response.json() == [
+        {"day": date_from, "total_comments": 4, "blocked_comments": 1}
+    ]
+
+    client.delete("/posts/1", headers=headers)
+    assert client.get("/comments/1", headers=headers).status_code == 404
+    assert client.get("/comments/", headers=headers).json() == []
+
+
+def test_update_post_with_if_match(client, override_get_db):
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+
+    etag = client.get("/posts/1", headers=headers).headers["ETag"]
+    response = client.put(
+        "/posts/1", json=DEFAULT_POST_DATA, headers={**headers, "If-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+    assert response.headers["ETag"] != etag
+
+    response = client.put(
+        "/posts/1", json=DEFAULT_POST_DATA, headers={**headers, "If-Match": etag}
+    )
+    assert response.status_code == 412
+
+
+def test_update_comment_with_stale_version(client, override_get_db):
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}"}
+    comment_data = {"text": "Test comment", "post_id": 1}
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    client.post("/comments/", json=comment_data, headers=headers)
+    client.put("/comments/1", json=comment_data, headers=headers)
+
+    response = client.put(
+        "/comments/1", json=comment_data, headers={**headers, "If-Match": '"1"'}
+    )
+    assert response.status_code == 412
+
+    response = client.put(
+        "/comments/2", json=comment_data, headers={**headers, "If-Match": '"1"'}
+    )
+    assert response.status_code == 404
+
+
+def test_deferred_moderation(client, db, override_get_db, monkeypatch):
+    monkeypatch.setattr(moderation, "MODERATION_MODE", "deferred")
+    create_test_user(client, "1@1.com", "test")
+    create_test_user(client, "2@2.com", "test")
+    author = {"Authorization": f"Bearer {get_auth_token(client, '1@1.com', 'test')}"}
+    reader = {"Authorization": f"Bearer {get_auth_token(client, '2@2.com', 'test')}"}
+    post_data = {**DEFAULT_POST_DATA, "text": "Fuck"}
+
+    response = client.post("/posts/", json=post_data, headers=author)
+    assert response.status_code == 201
+    assert response.json()["moderation_status"] == "pending"
+    assert response.json()["is_blocked"] is False
+
+    assert client.get("/posts/1", headers=author).status_code == 200
+    assert client.get("/posts/1", headers=reader).status_code == 404
+    assert client.get("/posts/", headers=author).headers["X-Total-Count"] == "1"
+    assert client.get("/posts/", headers=reader).headers["X-Total-Count"] == "0"
+
+    assert moderation_worker.moderate_pending(db) == 1
+    assert client.get("/posts/", headers=reader).headers["X-Total-Count"] == "1"
+
+    response = client.get("/posts/1", headers=reader)
+    assert response.status_code == 200
+    assert response.json()["moderation_status"] == "blocked"
+    assert response.json()["is_blocked"] is True
+    assert counters.read(db, counters.POSTS) == (1, 1)
+
+
+def test_moderation_stores_a_batch_in_one_update(
+    client, db, override_get_db, monkeypatch
+):
+    monkeypatch.setattr(moderation, "has_profanity", lambda text: "Fuck" in text)
+    monkeypatch.setattr(moderation, "MODERATION_MODE", "deferred")
+    create_test_user(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {get_auth_token(client, '1@1.com', 'test')}"}
+    for _ in range(2):
+        client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    for post_id, text in [(1, "Fuck"), (1, "Test comment"), (2, "Fuck")]:
+        client.post(
+            "/comments/", json={"text": text, "post_id": post_id}, headers=headers
+        )
+    client.delete("/posts/2", headers=headers)
+    # Author stats keep counting the comments of deleted posts until then.
+    counters.reconcile(db)
+
+    updates = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "UPDATE comments" in statement:
+            updates.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        assert moderation_worker.moderate_pending(db) == 4
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert len(updates) == 1
+    # The comment of the deleted post is moderated but no longer counted.
+    assert db.get(Comment, 3).moderation_status == moderation.BLOCKED
+    assert counters.read(db, counters.COMMENTS) == (2, 1)
+    assert counters.read(db, counters.POST_COMMENTS, 2) == (0, 0)
+    assert counters.reconcile(db) == 0
+
+
+def test_comment_events_wait_for_approval(client, db, override_get_db, monkeypatch):
+    published = []
+    monkeypatch.setattr(
+        events.broker,
+        "publish",
+        lambda channel, event_type, data: published.append((event_type, data["id"])),
+    )
+    create_test_user(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {get_auth_token(client, '1@1.com', 'test')}"}
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    monkeypatch.setattr(moderation, "MODERATION_MODE", "deferred")
+    for text in ["Test comment", "Fuck"]:
+        client.post("/comments/", json={"text": text, "post_id": 1}, headers=headers)
+    assert published == []
+
+    assert moderation_worker.moderate_pending(db) == 2
+    assert published == [("comment.created", 1)]
+
+    client.put("/comments/1", json={"text": "Fuck", "post_id": 1}, headers=headers)
+    client.put("/comments/2", json={"text": "Edited", "post_id": 1}, headers=headers)
+    moderation_worker.moderate_pending(db)
+    assert published == [("comment.created", 1), ("comment.updated", 2)]
+
+
+def test_remoderation_updates_changed_rows(
+    client, db, override_get_db, monkeypatch, tmp_path
+):
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    client.post(
+        "/posts/", json={**DEFAULT_POST_DATA, "text": "banned"}, headers=headers
+    )
+    monkeypatch.setattr(moderation, "has_profanity", lambda text: "banned" in text)
+    checkpoint = str(tmp_path / "checkpoint.json")
+    progress = {}
+
+    with remoderation.ThreadPoolExecutor(max_workers=2) as executor:
+        stats = remoderation.remoderate_table(
+            db, "posts", executor, progress, checkpoint, chunk_size=1
+        )
+
+    assert stats["checked"] == 2
+    assert stats["changed"] == 1
+    assert remoderation.load_checkpoint(checkpoint) == {"posts": 2}
+    assert [post.is_blocked for post in db.query(Post).order_by(Post.id)] == [
+        False,
+        True,
+    ]
+
+
+def test_get_posts_newest_first_with_cursor(client, override_get_db):
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(3):
+        client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+
+    response = client.get("/posts/?limit=2", headers=headers)
+    assert [post["id"] for post in response.json()] == [3, 2]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f"/posts/?limit=2&cursor={cursor}", headers=headers)
+    assert [post["id"] for post in response.json()] == [1]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_sparse_fieldsets(client, override_get_db):
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(2):
+        client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+
+    response = client.get("/posts/?limit=1&fields=title", headers=headers)
+    assert response.json() == [{"id": 2, "title": DEFAULT_POST_DATA["title"]}]
+    assert response.headers["X-Next-Cursor"]
+
+    response = client.get("/posts/1/?fields=text,author_id", headers=headers)
+    assert response.json() == {
+        "id": 1,
+        "text": DEFAULT_POST_DATA["text"],
+        "author_id": 1,
+    }
+    assert response.headers["ETag"]
+
+    response = client.get("/posts/?fields=title,password", headers=headers)
+    assert response.status_code == 422
+
+
+def test_total_counts_follow_writes_and_reconciliation(
+    client, db, override_get_db, monkeypatch
+):
+    monkeypatch.setattr(moderation, "has_profanity", lambda text: "Fuck" in text)
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(2):
+        client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    for post_id, text in [(1, "Test comment"), (1, "Fuck"), (2, "Test comment")]:
+        client.post(
+            "/comments/", json={"text": text, "post_id": post_id}, headers=headers
+        )
+    client.delete("/comments/1", headers=headers)
+
+    def totals():
+        return [
+            int(client.get(url, headers=headers).headers["X-Total-Count"])
+            for url in ["/posts/", "/comments/", "/comments/?post_id=1"]
+        ]
+
+    assert totals() == [2, 2, 1]
+    assert counters.read(db, counters.POST_COMMENTS, 1) == (1, 1)
+
+    client.delete("/posts/2", headers=headers)
+    assert totals() == [1, 1, 1]
+
+    db.query(Counter).delete()
+    db.commit()
+    assert totals() == [0, 0, 0]
+    # The author's stats still count the comment on the deleted post.
+    assert counters.reconcile(db) == 4
+    assert totals() == [1, 1, 1]
+    assert counters.read(db, counters.COMMENTS) == (1, 1)
+    assert counters.reconcile(db) == 0
+
+
+def test_author_posts_comments_and_stats(client, db, override_get_db, monkeypatch):
+    monkeypatch.setattr(moderation, "has_profanity", lambda text: "Fuck" in text)
+    create_test_user(client, "1@1.com", "test")
+    create_test_user(client, "2@2.com", "test")
+    author = {"Authorization": f"Bearer {get_auth_token(client, '1@1.com', 'test')}"}
+    reader = {"Authorization": f"Bearer {get_auth_token(client, '2@2.com', 'test')}"}
+    for headers in [author, reader, author, author]:
+        client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    for headers, text in [(author, "Test comment"), (reader, "Test"), (author, "Fuck")]:
+        client.post("/comments/", json={"text": text, "post_id": 2}, headers=headers)
+
+    response = client.get("/users/1/posts?limit=2", headers=reader)
+    assert [post["id"] for post in response.json()] == [4, 3]
+    response = client.get(
+        f"/users/1/posts?limit=2&cursor={response.headers['X-Next-Cursor']}",
+        headers=reader,
+    )
+    assert [post["id"] for post in response.json()] == [1]
+    response = client.get("/users/1/comments", headers=reader)
+    assert [comment["id"] for comment in response.json()] == [3, 1]
+    assert client.get("/users/3/posts", headers=reader).status_code == 404
+
+    client.delete("/posts/4", headers=author)
+    response = client.get("/users/1/stats", headers=reader)
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["posts"] == 2
+    assert (stats["comments"], stats["blocked_comments"]) == (2, 1)
+    assert stats["blocked_ratio"] == 0.25
+    assert stats["last_active_at"] is not None
+    assert client.get("/users/3/stats", headers=reader).status_code == 404
+
+    assert counters.reconcile(db) == 0
+
+
+def test_feed_from_followed_authors(client, db, override_get_db, monkeypatch):
+    create_test_user(client, "1@1.com", "test")
+    create_test_user(client, "2@2.com", "test")
+    author = {"Authorization": f"Bearer {get_auth_token(client, '1@1.com', 'test')}"}
+    reader = {"Authorization": f"Bearer {get_auth_token(client, '2@2.com', 'test')}"}
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=author)
+
+    assert client.post("/users/2/follow", headers=reader).status_code == 400
+    assert client.post("/users/3/follow", headers=reader).status_code == 404
+    assert client.post("/users/1/follow", headers=reader).status_code == 204
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=author)
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=reader)
+
+    response = client.get("/feed/?limit=2", headers=reader)
+    assert [post["id"] for post in response.json()] == [3, 2]
+    response = client.get(
+        f"/feed/?limit=2&cursor={response.headers['X-Next-Cursor']}", headers=reader
+    )
+    assert [post["id"] for post in response.json()] == [1]
+
+    # Authors above the fan-out limit are merged in at read time.
+    monkeypatch.setattr(feed, "FEED_FANOUT_LIMIT", 0)
+    client.post("/posts/", json=DEFAULT_POST_DATA, headers=author)
+    assert db.get(TimelineEntry, (2, 4)) is None
+    response = client.get("/feed/", headers=reader)
+    assert [post["id"] for post in response.json()] == [4, 3, 2, 1]
+
+    assert feed.trim_timelines(db, length=2) == 2
+    assert client.delete("/users/1/follow", headers=reader).status_code == 204
+    assert [post["id"] for post in client.get("/feed/", headers=reader).json()] == [3]
+
+
+def test_trending_posts(client, override_get_db, monkeypatch):
+    monkeypatch.setattr(trending, "ranking", trending.Ranking(engine))
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(3):
+        client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    for post_id in [2, 3, 3]:
+        client.post(
+            "/comments/",
+            json={"text": "Test comment", "post_id": post_id},
+            headers=headers,
+        )
+    client.post("/comments/", json={"text": "Fuck", "post_id": 2}, headers=headers)
+
+    response = client.get("/posts/trending", headers=headers)
+    assert response.status_code == 200
+    assert [item["post"]["id"] for item in response.json()] == [3, 2]
+    assert response.json()[0]["score"] == pytest.approx(2, rel=0.1)
+
+    client.delete("/comments/2", headers=headers)
+    client.delete("/comments/3", headers=headers)
+    client.delete("/posts/2", headers=headers)
+    response = client.get("/posts/trending?limit=1", headers=headers)
+    assert response.json() == []
+
+
+def test_auto_replies_trend_like_comments(client, override_get_db, monkeypatch):
+    monkeypatch.setattr(trending, "ranking", trending.Ranking(engine))
+    monkeypatch.setattr(crud, "generate_comment_reply", lambda text, post: "Thanks")
+    create_test_user(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {get_auth_token(client, '1@1.com', 'test')}"}
+    client.post(
+        "/posts/", json={**DEFAULT_POST_DATA, "auto_reply": True}, headers=headers
+    )
+    client.post("/comments/", json={"text": "Test", "post_id": 1}, headers=headers)
+    assert client.get("/comments/2", headers=headers).json()["text"] == "Thanks"
+
+    response = client.get("/posts/trending", headers=headers)
+    assert response.json()[0]["score"] == pytest.approx(2, rel=0.1)
+    # Deleting the reply leaves the post ranked by the comment it answered.
+    client.delete("/comments/2", headers=headers)
+    response = client.get("/posts/trending", headers=headers)
+    assert [item["post"]["id"] for item in response.json()] == [1]
+    assert response.json()[0]["score"] == pytest.approx(1, rel=0.1)
+
+
+def test_pending_comments_trend_once_approved(client, db, override_get_db, monkeypatch):
+    monkeypatch.setattr(trending, "ranking", trending.Ranking(engine))
+    create_test_user(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {get_auth_token(client, '1@1.com', 'test')}"}
+    for _ in range(2):
+        client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    monkeypatch.setattr(moderation, "MODERATION_MODE", "deferred")
+    for post_id, text in [(1, "Fuck"), (1, "Fuck"), (2, "Test comment")]:
+        client.post(
+            "/comments/", json={"text": text, "post_id": post_id}, headers=headers
+        )
+    assert client.get("/posts/trending", headers=headers).json() == []
+
+    moderation_worker.moderate_pending(db)
+    response = client.get("/posts/trending", headers=headers)
+    assert [item["post"]["id"] for item in response.json()] == [2]
+
+    # Re-moderation blocking an approved comment takes it out again.
+    moderation_worker.store_verdicts(db, Comment, [(3, 1, True)])
+    assert client.get("/posts/trending", headers=headers).json() == []
+
+
+def test_idempotency_key_replays_create(client, db, override_get_db, monkeypatch):
+    monkeypatch.setattr(idempotency, "store", idempotency.IdempotencyStore(engine))
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT", 0)
+    checked = []
+    monkeypatch.setattr(moderation, "has_profanity", checked.append)
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "a"}
+
+    first = client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    retry = client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert len(checked) == 1
+    assert db.query(Post).count() == 1
+
+    response = client.post(
+        "/posts/", json={**DEFAULT_POST_DATA, "title": "other"}, headers=headers
+    )
+    assert response.status_code == 422
+
+    # A failed request releases its key.
+    create_post = crud.create_post
+
+    def fail_once(**kwargs):
+        monkeypatch.setattr(crud, "create_post", create_post)
+        raise HTTPException(status_code=503)
+
+    monkeypatch.setattr(crud, "create_post", fail_once)
+    headers["Idempotency-Key"] = "b"
+    assert (
+        client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers).status_code
+        == 503
+    )
+    assert (
+        client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers).status_code
+        == 201
+    )
+
+    idempotency.store.begin(1, "c", "fingerprint")
+    with pytest.raises(idempotency.IdempotencyKeyInProgress):
+        idempotency.store.begin(1, "c", "fingerprint")
+
+
+def test_idempotent_replays_are_not_rate_limited(
+    client, db, override_get_db, monkeypatch
+):
+    monkeypatch.setattr(idempotency, "store", idempotency.IdempotencyStore(engine))
+    monkeypatch.setitem(rate_limit.LIMITS, "posts", rate_limit.parse_limit("1/60"))
+    create_test_user(client, "1@1.com", "test")
+    token = get_auth_token(client, "1@1.com", "test")
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "a"}
+
+    for _ in range(3):
+        response = client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+        assert response.status_code == 201
+
+    headers["Idempotency-Key"] = "b"
+    response = client.post("/posts/", json=DEFAULT_POST_DATA, headers=headers)
+    assert response.status_code == 429
+    # The throttled request released its key, so it can be retried later.
+    assert db.query(IdempotencyKey).count() == 1
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db.engine import Base
+from user.revocation import BloomFilter, RevocationList
+
+
+@pytest.fixture
+def db(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path}/revocation.db")
+    Base.metadata.create_all(bind=bind)
+    db = sessionmaker(bind=bind)()
+    yield db
+    db.close()
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    for number in range(1000):
+        bloom.add(f"jti-{number}")
+
+    assert all(f"jti-{number}" in bloom for number in range(1000))
+    false_positives = sum(f"other-{number}" in bloom for number in range(10000))
+    assert false_positives < 300
+
+
+def test_revocations_reach_other_workers_on_refresh(db):
+    worker = RevocationList(refresh_interval=3600)
+    other_worker = RevocationList(refresh_interval=3600)
+    assert not other_worker.is_revoked(db, "a")
+
+    worker.revoke(db, "a", user_id=1, expires_at=time.time() + 60)
+
+    assert worker.is_revoked(db, "a")
+    assert not other_worker.is_revoked(db, "a")
+    other_worker.refresh(db)
+    assert other_worker.is_revoked(db, "a")
+    assert not other_worker.is_revoked(db, "b")
+
+
+def test_expired_revocations_are_purged(db):
+    revocations = RevocationList()
+    revocations.revoke(db, "old", user_id=1, expires_at=time.time() - 1)
+    revocations.revoke(db, "new", user_id=1, expires_at=time.time() + 60)
+
+    revocations.purge_expired(db)
+
+    assert not revocations.is_revoked(db, "old")
+    assert revocations.is_revoked(db, "new")
@@ -0,0 +1,124 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app import counters, crud, moderation_worker, schemas
+from db import sharding
+from db.engine import Base
+from db.models import Comment, Post
+
+
+def test_jump_hash_is_stable_and_moves_few_keys():
+    before = [sharding.jump_hash(key, 4) for key in range(10000)]
+    after = [sharding.jump_hash(key, 5) for key in range(10000)]
+
+    assert before == [sharding.jump_hash(key, 4) for key in range(10000)]
+    moved = [(old, new) for old, new in zip(before, after) if old != new]
+    assert all(new == 4 for _, new in moved)
+    assert 1500 < len(moved) < 2500
+
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    urls = [f"sqlite:///{tmp_path}/shard{index}.db" for index in range(2)]
+    sharding.init_shards(urls)
+    monkeypatch.setattr(
+        sharding,
+        "shard_sessions",
+        [sessionmaker(bind=sharding.create_shard_engine(url)) for url in urls],
+    )
+    return urls
+
+
+def add_comments(post_ids):
+    for comment_id, post_id in enumerate(post_ids, start=1):
+        with sharding.comment_session(None, post_id) as session:
+            session.add(
+                Comment(
+                    id=comment_id,
+                    post_id=post_id,
+                    author_id=1,
+                    text=f"comment {comment_id}",
+                    date_time_created=datetime(2024, 1, 1),
+                )
+            )
+            session.commit()
+
+
+def test_comments_are_routed_by_post_and_merged_across_shards(shards, monkeypatch):
+    monkeypatch.setattr(crud, "hidden_post_ids_among", lambda db, post_ids: set())
+    post_ids = [1, 2, 3, 4, 1, 2]
+    add_comments(post_ids)
+
+    counts = sharding.fan_out(None, lambda session: session.query(Comment).count())
+    assert sum(counts) == 6 and all(counts)
+
+    assert [comment.id for comment in crud.get_all_comments(None, post_id=1)] == [
+        1,
+        5,
+    ]
+    assert [
+        comment.id for comment in crud.get_all_comments(None, cursor=6, limit=3)
+    ] == [5, 4, 3]
+    assert crud.get_comment_by_id(None, 4).post_id == 4
+    assert crud.comments_analysis(None, "2023-12-31", "2024-01-02") == [
+        {"day": "2024-01-01", "total_comments": 6, "blocked_comments": 0}
+    ]
+
+
+def test_comments_of_deleted_posts_are_hidden(shards, tmp_path):
+    main = create_engine(f"sqlite:///{tmp_path}/main.db")
+    Base.metadata.create_all(main)
+    db = sessionmaker(bind=main)()
+    for post_id, deleted_at in [(1, None), (2, datetime(2024, 1, 2))]:
+        db.add(Post(id=post_id, title="t", text="t", deleted_at=deleted_at))
+    db.commit()
+    add_comments([1, 2, 2, 2, 1])
+
+    # The page of deleted comments is skipped and the next one fills it.
+    assert [comment.id for comment in crud.get_all_comments(db, limit=2)] == [5, 1]
+    assert crud.get_all_comments(db, post_id=2) == []
+    assert crud.get_comment_by_id(db, 3) is None
+    update = schemas.CommentCreate(text="edited", post_id=2)
+    assert crud.update_comment(db, 3, update) is None
+    assert crud.update_comment(db, 5, update).text == "edited"
+    assert crud.comments_analysis(db, "2023-12-31", "2024-01-02") == [
+        {"day": "2024-01-01", "total_comments": 2, "blocked_comments": 0}
+    ]
+
+    with sharding.comment_session(db, 2) as session:
+        moderation_worker.store_verdicts(session, Comment, [(3, 1, True)], db)
+        assert session.get(Comment, 3).is_blocked
+        assert counters.read(session, counters.POST_COMMENTS, 2) == (0, 0)
+
+    # Counters of the deleted post are dropped and its comments left uncounted.
+    assert counters.reconcile(db) > 0
+    assert counters.total_comments(db) == 2
+    assert counters.total_comments(db, 2) == 0
+    assert counters.author_stats(db, 1)["comments"] == 2
+    assert counters.reconcile(db) == 0
+    db.close()
+
+
+def test_rebalance_moves_comments_to_their_new_shard(shards, tmp_path):
+    post_ids = list(range(1, 41))
+    add_comments(post_ids)
+    target_urls = shards + [f"sqlite:///{tmp_path}/shard2.db"]
+    sharding.init_shards(target_urls)
+
+    moved = sharding.rebalance(shards, target_urls, keep_source=False)
+
+    assert moved > 0
+    for index, url in enumerate(target_urls):
+        with create_engine(url).connect() as connection:
+            stored = connection.execute(select(Comment.post_id)).scalars().all()
+        assert all(
+            sharding.jump_hash(post_id, len(target_urls)) == index for post_id in stored
+        )
+    total = 0
+    for url in target_urls:
+        with create_engine(url).connect() as connection:
+            total += len(connection.execute(select(Comment.id)).all())
+    assert total == len(post_ids)
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from app.spam import (
+    SPAM_SIMILARITY,
+    DuplicateIndex,
+    normalize,
+    shingles,
+    signature,
+    similarity,
+)
+
+TEXT = "Check out my amazing crypto giveaway at example dot com, you will not regret it"
+EDITS = [
+    TEXT.replace("amazing", "awesome"),
+    TEXT.replace("crypto", "bitcoin"),
+    TEXT.replace("regret", "forget"),
+    TEXT + " today",
+]
+
+
+def jaccard(a: str, b: str) -> float:
+    a, b = shingles(normalize(a)), shingles(normalize(b))
+    return len(a & b) / len(a | b)
+
+
+def test_similarity_estimates_jaccard():
+    original = signature(normalize(TEXT))
+
+    assert similarity(original, signature(normalize(TEXT.upper() + "!!"))) == 1
+    for text in EDITS + ["The part about database indexes was very clear"]:
+        estimate = similarity(original, signature(normalize(text)))
+        # Three standard deviations of the estimator at 128 hash functions.
+        assert estimate == pytest.approx(jaccard(TEXT, text), abs=0.13)
+
+
+def test_one_word_edits_are_rejected_at_the_default_threshold():
+    assert all(jaccard(TEXT, text) > SPAM_SIMILARITY + 0.13 for text in EDITS)
+    index = DuplicateIndex()
+
+    assert not any(index.is_flood(1, text, now=0) for text in EDITS[:3])
+    assert index.is_flood(1, EDITS[3], now=1)
+
+
+def test_author_and_global_limits():
+    index = DuplicateIndex(author_limit=2, global_limit=3)
+
+    assert not index.is_flood(1, TEXT, now=0)
+    assert not index.is_flood(1, TEXT + "!", now=1)
+    assert index.is_flood(1, TEXT, now=2)
+    assert not index.is_flood(2, TEXT, now=3)
+    assert index.is_flood(3, TEXT, now=4)
+    assert len(index) == 3
+
+
+def test_short_and_expired_comments_are_not_floods():
+    index = DuplicateIndex(window=60, author_limit=1)
+
+    assert not index.is_flood(1, "Thanks!", now=0)
+    assert not index.is_flood(1, "Thanks!", now=1)
+    assert not index.is_flood(1, TEXT, now=0)
+    assert index.is_flood(1, TEXT, now=30)
+    assert not index.is_flood(1, TEXT, now=61)
+    assert len(index) == 1
+
+
+def test_index_size_is_bounded():
+    index = DuplicateIndex(max_entries=10)
+
+    for number in range(100):
+        index.is_flood(number, f"{TEXT} number {number}", now=number)
+
+    assert len(index) == 10
+
+
+def test_long_comments_are_checked_in_bounded_time():
+    index = DuplicateIndex()
+    text = " ".join(f"{TEXT} {number}" for number in range(2000))
+
+    started = time.perf_counter()
+    assert not index.is_flood(1, text, now=0)
+    assert time.perf_counter() - started < 0.1
+    # Copies that only differ past the compared prefix are still copies.
+    assert not index.is_flood(1, text + " spam", now=1)
+    assert not index.is_flood(1, text + " more", now=2)
+    assert index.is_flood(1, text, now=3)
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine
+
+from app.trending import Ranking
+from db.engine import Base
+
+
+@pytest.fixture
+def bind(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path}/trending.db")
+    Base.metadata.create_all(bind=bind)
+    return bind
+
+
+def ranked(ranking: Ranking) -> list[int]:
+    return [post_id for post_id, _ in ranking.top(10)]
+
+
+def test_top_k_follows_activity(bind):
+    ranking = Ranking(bind, top_k=2)
+    now = time.time()
+    for post_id, comments in [(1, 4), (2, 3), (3, 1)]:
+        for _ in range(comments):
+            ranking.record(post_id, now)
+    assert ranked(ranking) == [1, 2]
+
+    ranking.record(1, now, delta=-1)
+    ranking.record(1, now, delta=-1)
+    assert ranked(ranking) == [2, 1]
+
+    for _ in range(3):
+        ranking.record(2, now, delta=-1)
+    assert ranked(ranking) == [1, 3]
+
+
+def test_recent_activity_outranks_older_activity(bind):
+    ranking = Ranking(bind, half_life=3600)
+    now = time.time()
+    for _ in range(3):
+        ranking.record(1, now - 2 * 3600)
+    ranking.record(2, now)
+
+    (first, first_score), (second, second_score) = ranking.top(2)
+    assert (first, second) == (2, 1)
+    assert first_score == pytest.approx(1, rel=0.1)
+    assert second_score == pytest.approx(0.75, rel=0.1)
+
+
+def test_workers_converge_and_recover_through_the_table(bind):
+    worker, other_worker = Ranking(bind), Ranking(bind)
+    now = time.time()
+    worker.record(1, now)
+    other_worker.record(2, now)
+    other_worker.record(2, now)
+
+    worker.sync()
+    other_worker.sync()
+    worker.sync()
+    assert ranked(worker) == ranked(other_worker) == [2, 1]
+
+    restarted = Ranking(bind)
+    restarted.sync()
+    assert ranked(restarted) == ranked(worker)
+    assert [score for _, score in restarted.top(10)] == pytest.approx(
+        [score for _, score in worker.top(10)]
+    )
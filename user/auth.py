@@ -1,4 +1,5 @@
 import os
+import uuid
 from datetime import timedelta, datetime
 
 from dotenv import load_dotenv
@@ -12,6 +13,9 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ADMIN_EMAILS = {
+    email.strip() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()
+}
 
 
 def verify_password(plain_password, hashed_password) -> bool:
@@ -28,6 +32,10 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+
+def is_admin(email: str) -> bool:
+    return email in ADMIN_EMAILS
@@ -0,0 +1,164 @@
+"""Revocation of access tokens by their ``jti`` claim.
+
+Revoked ids are stored in the ``revoked_tokens`` table until the token
+expires. Each worker mirrors the table into a Bloom filter that it refreshes
+incrementally every ``REVOCATION_REFRESH_INTERVAL`` seconds, so checking a
+token that was not revoked, which is nearly every request, needs no query.
+Only ids the filter may contain are looked up in the table.
+
+A token revoked on another worker is rejected here once the next refresh
+has run, i.e. after at most ``REVOCATION_REFRESH_INTERVAL`` seconds.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from db.engine import SessionLocal
+from db.models import RevokedToken
+
+load_dotenv()
+
+REVOCATION_REFRESH_INTERVAL = float(os.getenv("REVOCATION_REFRESH_INTERVAL", 1))
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", 100_000))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", 0.001))
+REVOCATION_CLEANUP_INTERVAL = float(os.getenv("REVOCATION_CLEANUP_INTERVAL", 300))
+# Revocations committed out of order, or by a worker whose clock is behind,
+# are picked up by re-reading this many seconds before the last refresh.
+REFRESH_OVERLAP = 5
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.size = max(
+            64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> list[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        step = int.from_bytes(digest[8:], "big") | 1
+        return [(first + index * step) % self.size for index in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class RevocationList:
+    def __init__(
+        self,
+        capacity: int = REVOCATION_BLOOM_CAPACITY,
+        error_rate: float = REVOCATION_BLOOM_ERROR_RATE,
+        refresh_interval: float = REVOCATION_REFRESH_INTERVAL,
+    ) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self._refresh_lock = threading.Lock()
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._refreshed_at: float | None = None
+        self._next_refresh = 0.0
+
+    def revoke(self, db: Session, jti: str, user_id: int, expires_at: float) -> None:
+        insert = (
+            postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+        )
+        db.execute(
+            insert(RevokedToken)
+            .values(
+                jti=jti, user_id=user_id, expires_at=expires_at, revoked_at=time.time()
+            )
+            .on_conflict_do_nothing()
+        )
+        db.commit()
+        self._bloom.add(jti)
+
+    def is_revoked(self, db: Session, jti: str) -> bool:
+        if time.monotonic() >= self._next_refresh:
+            self.refresh(db)
+        if jti not in self._bloom:
+            return False
+        return (
+            db.execute(select(RevokedToken.jti).where(RevokedToken.jti == jti)).first()
+            is not None
+        )
+
+    def refresh(self, db: Session) -> None:
+        """Add the ids revoked since the last refresh to the filter."""
+        # Requests arriving during a refresh keep using the current filter.
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.time()
+            if self._refreshed_at is None:
+                self._rebuild(db, now)
+            else:
+                revoked = db.scalars(
+                    select(RevokedToken.jti).where(
+                        RevokedToken.revoked_at >= self._refreshed_at - REFRESH_OVERLAP,
+                        RevokedToken.expires_at > now,
+                    )
+                )
+                for jti in revoked:
+                    if jti not in self._bloom:
+                        self._bloom.add(jti)
+                if self._bloom.count > self._bloom.capacity:
+                    self._rebuild(db, now)
+            self._refreshed_at = now
+            self._next_refresh = time.monotonic() + self.refresh_interval
+        finally:
+            self._refresh_lock.release()
+
+    def _rebuild(self, db: Session, now: float) -> None:
+        revoked = db.scalars(
+            select(RevokedToken.jti).where(RevokedToken.expires_at > now)
+        ).all()
+        bloom = BloomFilter(max(self.capacity, 2 * len(revoked)), self.error_rate)
+        for jti in revoked:
+            bloom.add(jti)
+        self._bloom = bloom
+
+    def purge_expired(self, db: Session) -> None:
+        """Delete expired revocations and drop them from the filter."""
+        now = time.time()
+        db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+        db.commit()
+        with self._refresh_lock:
+            self._rebuild(db, now)
+            self._refreshed_at = now
+
+    def reset(self) -> None:
+        with self._refresh_lock:
+            self._bloom = BloomFilter(self.capacity, self.error_rate)
+            self._refreshed_at = None
+            self._next_refresh = 0.0
+
+
+revocations = RevocationList()
+
+
+def run_cleanup() -> None:
+    db = SessionLocal()
+    try:
+        revocations.purge_expired(db)
+    finally:
+        db.close()
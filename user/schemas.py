@@ -6,6 +6,10 @@ class Token(BaseModel):
     token_type: str
 
 
+class TokenRevoke(BaseModel):
+    token: str
+
+
 class TokenData(BaseModel):
     username: str | None = None
 